@@ -0,0 +1,169 @@
+import asyncio
+import json
+from collections import Counter, deque
+from database import engine, replicas
+from instrumentation import _counter, _labels
+import settings
+
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+# long-lived streams hold no pooled connection and must not take a slot for their whole lifetime
+EXEMPT_PATHS = {"/metrics", "/admission/stats", "/shows/seats/stream/"}
+# used when a pool does not report its size (NullPool, StaticPool)
+DEFAULT_POOL_CAPACITY = 10
+
+
+def pool_capacity(engine) -> int:
+    pool = engine.pool
+    if not hasattr(pool, "size") or not hasattr(pool, "_max_overflow"):
+        return DEFAULT_POOL_CAPACITY
+    return pool.size() + max(pool._max_overflow, 0)
+
+
+# writes get half of the primary's connections, reads the other half plus every replica's, so
+# admitted requests never wait on the pool
+def default_limits(primary, replicas: list) -> dict[str, int]:
+    capacity = pool_capacity(primary)
+    write = settings.ADMISSION_WRITE_LIMIT or max(1, capacity // 2)
+    read = settings.ADMISSION_READ_LIMIT or max(1, capacity - write) + sum(pool_capacity(replica) for replica in replicas)
+    return {"read": read, "write": write}
+
+
+def route_class(method: str) -> str:
+    return "read" if method in READ_METHODS else "write"
+
+
+class RouteClass:
+    def __init__(self, name: str, limit: int, queue_size: int):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.active = 0
+        self.waiters: deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.queued = 0
+        self.shed: Counter = Counter()
+
+    async def acquire(self, timeout: float) -> bool:
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            self.admitted += 1
+            return True
+
+        if len(self.waiters) >= self.queue_size:
+            self.shed["queue_full"] += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            self._forget(waiter)
+            # the timeout can fire after the slot was handed over, the request then holds it
+            if not (waiter.done() and not waiter.cancelled()):
+                self.shed["timeout"] += 1
+                return False
+        except BaseException:
+            # a disconnect can land right after the slot was handed over, pass it on
+            self._forget(waiter)
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+
+        self.admitted += 1
+        return True
+
+    def _forget(self, waiter: asyncio.Future):
+        try:
+            self.waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    # hands the slot straight to the oldest waiter, so a queued request cannot be overtaken
+    def release(self):
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queue_depth": len(self.waiters),
+            "queue_size": self.queue_size,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed_queue_full": self.shed["queue_full"],
+            "shed_timeout": self.shed["timeout"],
+        }
+
+
+class AdmissionController:
+    def __init__(self, limits: dict[str, int], queue_size: int, timeout: float):
+        self.timeout = timeout
+        self.classes = {name: RouteClass(name, limit, queue_size) for name, limit in limits.items()}
+
+    def stats(self) -> dict:
+        return {name: route.stats() for name, route in self.classes.items()}
+
+    def render(self) -> list[str]:
+        stats = self.stats()
+        lines = []
+        for name, help, key in (
+            ("admission_limit", "Concurrent requests admitted per route class.", "limit"),
+            ("admission_active", "Requests currently running per route class.", "active"),
+            ("admission_queue_depth", "Requests waiting for a slot per route class.", "queue_depth"),
+        ):
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+            lines += [f"{name}{_labels((('class', route),))} {values[key]}" for route, values in stats.items()]
+        lines += _counter("admission_admitted_total", "Requests admitted per route class.", {
+            (("class", route),): values["admitted"] for route, values in stats.items()
+        })
+        lines += _counter("admission_shed_total", "Requests answered 503 per route class and reason.", {
+            (("class", route), ("reason", reason)): values[f"shed_{reason}"] for route, values in stats.items() for reason in ("queue_full", "timeout")
+        })
+        return lines
+
+
+admission_control = AdmissionController(
+    default_limits(engine, replicas.engines), settings.ADMISSION_QUEUE_SIZE, settings.ADMISSION_QUEUE_TIMEOUT_SECONDS,
+)
+
+
+# caps the requests running per route class; the rest wait in a bounded queue for a limited time
+# and are answered 503 with Retry-After instead of piling up on the threadpool and the pool
+class AdmissionMiddleware:
+    def __init__(self, app, controller: AdmissionController | None = None):
+        self.app = app
+        self.controller = controller or admission_control
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS:
+            return await self.app(scope, receive, send)
+
+        route = self.controller.classes[route_class(scope["method"])]
+        if not await route.acquire(self.controller.timeout):
+            return await _overloaded(send)
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            route.release()
+
+
+async def _overloaded(send):
+    body = json.dumps({"detail": "The server is overloaded, retry later."}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 503,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(settings.ADMISSION_RETRY_AFTER_SECONDS).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
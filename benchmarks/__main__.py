@@ -0,0 +1,106 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from dataclasses import asdict
+from datetime import datetime, timezone
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Load benchmark for the ticketing API.")
+    parser.add_argument("--customers", type=int, default=1000)
+    parser.add_argument("--shows", type=int, default=100)
+    parser.add_argument("--avanues", type=int, default=10)
+    parser.add_argument("--enrollments", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=200, help="Requests sent per scenario.")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients per scenario.")
+    parser.add_argument("--bulk-size", type=int, default=50, help="Customers per bulk enrollment request.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the generated data.")
+    parser.add_argument("--scenario", action="append", default=[], help="Only run the named scenario (repeatable).")
+    parser.add_argument("--db-file", help="Keep the SQLite database at this path instead of a throwaway one.")
+    parser.add_argument("--async-driver", action="store_true", help="Run against sqlite+aiosqlite (async mode).")
+    parser.add_argument("--orm-lists", action="store_true", help="Serve list endpoints through ORM entities and response models (LIST_FAST_PATH=false).")
+    parser.add_argument("--output", default="bench_results.json", help="Where to write the JSON results.")
+
+    return parser.parse_args(argv)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.db_file:
+        path = os.path.abspath(args.db_file)
+        if os.path.exists(path):
+            os.remove(path)
+    else:
+        # a RAM-backed file where available: SQLite's own :memory: cannot be shared across the threadpool
+        directory = "/dev/shm" if os.path.isdir("/dev/shm") else None
+        handle, path = tempfile.mkstemp(prefix="ticket-bench-", suffix=".db", dir=directory)
+        os.close(handle)
+        os.remove(path)
+
+    driver = "sqlite+aiosqlite" if args.async_driver else "sqlite"
+    # the app reads its settings at import time, so they have to be in place first
+    os.environ["DATABASE_URL"] = f"{driver}:///{path}"
+    os.environ["LIST_FAST_PATH"] = "false" if args.orm_lists else "true"
+
+    from benchmarks.runner import BenchConfig, run_benchmark
+    import database
+
+    database.engine.echo = False
+    config = BenchConfig(
+        customers=args.customers,
+        shows=args.shows,
+        avanues=args.avanues,
+        enrollments=args.enrollments,
+        requests=args.requests,
+        concurrency=args.concurrency,
+        bulk_size=args.bulk_size,
+        seed=args.seed,
+        scenarios=args.scenario,
+    )
+
+    try:
+        results = asyncio.run(run_benchmark(config))
+    finally:
+        if not args.db_file and os.path.exists(path):
+            os.remove(path)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "database_url": os.environ["DATABASE_URL"],
+            "async_mode": database.async_mode,
+            "list_fast_path": not args.orm_lists,
+            "config": asdict(config),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    width = max(len(name) for name in results) if results else 0
+    for name, result in results.items():
+        print(
+            f"{name:<{width}}  {result['throughput_rps']:>9.1f} req/s  p50 {result['p50_ms']:>8.2f}ms  "
+            f"p95 {result['p95_ms']:>8.2f}ms  p99 {result['p99_ms']:>8.2f}ms  sql/req {result['sql_per_request_mean']:>6.2f}  "
+            f"errors {result['errors']}"
+        )
+    print(f"results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
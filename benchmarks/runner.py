@@ -0,0 +1,271 @@
+import asyncio
+import inspect
+import random
+import time
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable
+import httpx
+from sqlalchemy import event
+import database
+from database import SessionLocal, run_in_session
+from main import app
+from benchmarks import seed as seeding
+import occupancy
+from deletion import deletion_jobs
+
+REQUEST_HEADER = b"x-bench-request"
+
+_statements: ContextVar[list | None] = ContextVar("bench_statements", default=None)
+
+
+@event.listens_for(database.engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    counter = _statements.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+# counts the statements each request runs, including those of a streamed body, keyed by
+# the request number the client sends along
+class StatementCountingApp:
+    def __init__(self, app):
+        self.app = app
+        self.counts: dict[str, int] = {}
+
+    async def __call__(self, scope, receive, send):
+        request_id = dict(scope.get("headers", [])).get(REQUEST_HEADER)
+        if scope["type"] != "http" or request_id is None:
+            return await self.app(scope, receive, send)
+
+        counter = [0]
+        token = _statements.set(counter)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _statements.reset(token)
+            self.counts[request_id.decode()] = counter[0]
+
+
+@dataclass
+class BenchConfig:
+    customers: int = 1000
+    shows: int = 100
+    avanues: int = 10
+    enrollments: int = 5000
+    requests: int = 200
+    concurrency: int = 16
+    bulk_size: int = 50
+    seed: int = 0
+    scenarios: list[str] = field(default_factory=list)
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    # called with the request number, returns the url and the json body
+    build: Callable[[int], tuple[str, dict | None]]
+    setup: Callable | None = None
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+
+    return ordered[rank]
+
+
+async def _in_session(fn, *args):
+    db = SessionLocal()
+    try:
+        return await run_in_session(db, fn, *args)
+    finally:
+        closed = db.close()
+        if inspect.isawaitable(closed):
+            await closed
+
+
+def build_scenarios(config: BenchConfig, info: seeding.SeedInfo, rng: random.Random) -> tuple[list[Scenario], dict]:
+    n = config.requests
+    customer = lambda: rng.choice(info.customer_ids)
+    show = lambda: rng.choice(info.show_ids)
+    avanue = lambda: rng.choice(info.avanue_ids)
+    prepared = {}
+
+    def setup_enroll(db):
+        shows = seeding.add_shows(db, max(1, n // 10), n, "bench enroll show")
+        customers = seeding.add_customers(db, n, 30, "bench enroll customer")
+        prepared["enroll"] = [(customers[i], shows[i % len(shows)]) for i in range(n)]
+
+    def setup_bulk(db):
+        shows = seeding.add_shows(db, n, config.bulk_size, "bench bulk show")
+        customers = seeding.add_customers(db, n * config.bulk_size, 30, "bench bulk customer")
+        prepared["bulk"] = [(shows[i], customers[i * config.bulk_size:(i + 1) * config.bulk_size]) for i in range(n)]
+
+    def setup_show_to_avanue(db):
+        prepared["show_to_avanue"] = (
+            seeding.add_shows(db, n, 100, "bench unassigned show"),
+            seeding.add_avanues(db, max(1, n // 10), "bench open avanue"),
+        )
+
+    def setup_remove_customer(db):
+        shows = seeding.add_shows(db, max(1, n // 10), 100, "bench leave show")
+        customers = seeding.add_customers(db, n, 30, "bench leave customer")
+        pairs = [(customers[i], shows[i % len(shows)]) for i in range(n)]
+        seeding.add_enrollments(db, pairs)
+        prepared["remove_customer"] = pairs
+
+    def setup_remove_show(db):
+        avanue_id = seeding.add_avanues(db, 1, "bench closing avanue")[0]
+        prepared["remove_show"] = (seeding.add_shows(db, n, 100, "bench assigned show", avanue_id), avanue_id)
+
+    def setup_delete_customer(db):
+        prepared["delete_customer"] = seeding.add_customers(db, n, 30, "bench doomed customer")
+
+    def setup_delete_show(db):
+        prepared["delete_show"] = seeding.add_shows(db, n, 100, "bench doomed show")
+
+    def setup_delete_avanue(db):
+        prepared["delete_avanue"] = seeding.add_avanues(db, n, "bench doomed avanue")
+
+    def setup_contention(db):
+        # half of the clients get a seat, the other half must be turned away
+        prepared["hot_show"] = seeding.add_shows(db, 1, n // 2, "bench hot show")[0]
+        prepared["hot_customers"] = seeding.add_customers(db, n, 30, "bench fan")
+
+    def show_to_avanue(i):
+        shows, avanues = prepared["show_to_avanue"]
+        return f"/general_services/show_to_avanue/?show_id={shows[i]}&avanue_id={avanues[i % len(avanues)]}", None
+
+    def remove_show(i):
+        shows, avanue_id = prepared["remove_show"]
+        return f"/general_services/remove_show_from_avanue?show_id={shows[i]}&avanue_id={avanue_id}", None
+
+    def bulk(i):
+        show_id, customer_ids = prepared["bulk"][i]
+        return "/general_services/enroll_customers_to_show/", {"show_id": show_id, "customer_ids": customer_ids}
+
+    def update(kind):
+        def build(i):
+            id = {"customer": customer, "show": show, "avanue": avanue}[kind]()
+            body = {
+                "customer": {"name": f"renamed {i}"},
+                "show": {"title": f"retitled {i}"},
+                "avanue": {"name": f"renamed {i}"},
+            }[kind]
+            return f"/update/{kind}/{id}?id={id}", body
+        return build
+
+    return [
+        Scenario("list_customers", "GET", lambda i: ("/?limit=100", None)),
+        Scenario("stream_customers", "GET", lambda i: ("/?stream=true", None)),
+        Scenario("customer_detail", "GET", lambda i: (f"/customer/{customer()}", None)),
+        Scenario("customer_batch", "GET", lambda i: ("/customers/batch/?ids=" + ",".join(str(customer()) for _ in range(20)), None)),
+        Scenario("list_shows", "GET", lambda i: ("/shows/?limit=100", None)),
+        Scenario("show_detail", "GET", lambda i: (f"/show/{show()}", None)),
+        Scenario("search_shows", "GET", lambda i: (f"/shows/search/?eligible_for_customer={customer()}&min_seats=1&avanue_available=true&limit=50", None)),
+        Scenario("list_avanues", "GET", lambda i: ("/avanues/?limit=100", None)),
+        Scenario("avanue_detail", "GET", lambda i: (f"/avanue/{avanue()}", None)),
+        Scenario("cache_stats", "GET", lambda i: ("/cache/stats", None)),
+        Scenario("show_stats", "GET", lambda i: (f"/stats/show/{show()}", None)),
+        Scenario("avanue_stats", "GET", lambda i: (f"/stats/avanue/{avanue()}", None)),
+        Scenario("add_customer", "POST", lambda i: ("/add/customer/", {"name": f"bench new {i}", "age": 30})),
+        Scenario("add_show", "POST", lambda i: ("/add/show/", {"title": f"bench new {i}", "age_limit": 12, "head_count": 100})),
+        Scenario("add_avanue", "POST", lambda i: ("/add/avanue/", {"name": f"bench new {i}", "availability": True})),
+        Scenario(
+            "enroll_customer_to_show", "POST",
+            lambda i: ("/general_services/enroll_customer_to_show/?customer_id={}&show_id={}".format(*prepared["enroll"][i]), None),
+            setup_enroll,
+        ),
+        Scenario("enroll_customers_to_show", "POST", bulk, setup_bulk),
+        Scenario("show_to_avanue", "POST", show_to_avanue, setup_show_to_avanue),
+        Scenario("update_customer", "PATCH", update("customer")),
+        Scenario("update_show", "PATCH", update("show")),
+        Scenario("update_avanue", "PATCH", update("avanue")),
+        Scenario(
+            "remove_customer_from_show", "DELETE",
+            lambda i: ("/general_services/remove_customer_from_show/?customer_id={}&show_id={}".format(*prepared["remove_customer"][i]), None),
+            setup_remove_customer,
+        ),
+        Scenario("remove_show_from_avanue", "DELETE", remove_show, setup_remove_show),
+        Scenario("delete_customer", "DELETE", lambda i: (f"/delete/customer/{prepared['delete_customer'][i]}", None), setup_delete_customer),
+        Scenario("delete_show", "DELETE", lambda i: (f"/delete/show/{prepared['delete_show'][i]}", None), setup_delete_show),
+        Scenario("delete_avanue", "DELETE", lambda i: (f"/delete/avanue/{prepared['delete_avanue'][i]}", None), setup_delete_avanue),
+        Scenario(
+            "contention_enroll", "POST",
+            lambda i: (f"/general_services/enroll_customer_to_show/?customer_id={prepared['hot_customers'][i]}&show_id={prepared['hot_show']}", None),
+            setup_contention,
+        ),
+    ], prepared
+
+
+async def run_scenario(client: httpx.AsyncClient, counting: StatementCountingApp, scenario: Scenario, config: BenchConfig) -> dict:
+    latencies = []
+    statements = []
+    statuses = Counter()
+    queue = iter(range(config.requests))
+
+    async def worker():
+        for i in queue:
+            url, body = scenario.build(i)
+            request_id = f"{scenario.name}-{i}"
+            started = time.perf_counter()
+            response = await client.request(scenario.method, url, json=body, headers={REQUEST_HEADER.decode(): request_id})
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] += 1
+            statements.append(counting.counts.pop(request_id, 0))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(config.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "method": scenario.method,
+        "requests": len(latencies),
+        "status_counts": {str(status): count for status, count in sorted(statuses.items())},
+        "errors": sum(count for status, count in statuses.items() if status >= 400),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "sql_per_request_mean": round(sum(statements) / len(statements), 2) if statements else 0.0,
+        "sql_per_request_max": max(statements, default=0),
+    }
+
+
+async def run_benchmark(config: BenchConfig) -> dict:
+    await database.init_db()
+    rng = random.Random(config.seed)
+    info = await _in_session(seeding.seed, config.customers, config.shows, config.avanues, config.enrollments, rng)
+    # the seed writes the tables directly, the statistics are computed from them afterwards
+    await _in_session(occupancy.rebuild)
+    scenarios, prepared = build_scenarios(config, info, rng)
+    if config.scenarios:
+        scenarios = [scenario for scenario in scenarios if scenario.name in config.scenarios]
+
+    results = {}
+    counting = StatementCountingApp(app)
+    transport = httpx.ASGITransport(app=counting)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for scenario in scenarios:
+            if scenario.setup is not None:
+                await _in_session(scenario.setup)
+                await _in_session(occupancy.rebuild)
+            results[scenario.name] = await run_scenario(client, counting, scenario, config)
+            # deletes finish in the background, they must not overlap the next scenario
+            await deletion_jobs.drain()
+
+    if "hot_show" in prepared:
+        head_count, attendees = await _in_session(seeding.attendance, prepared["hot_show"])
+        results["contention_enroll"].update({
+            "seats": config.requests // 2,
+            "admitted": attendees,
+            "head_count_after": head_count,
+            "oversold": attendees > config.requests // 2 or head_count < 0,
+        })
+
+    return results
@@ -0,0 +1,94 @@
+import random
+from dataclasses import dataclass, field
+from sqlalchemy import insert, select, func
+from sqlalchemy.orm import Session
+from models import CustomerORM, ShowORM, AvanueORM, customer_show
+
+
+@dataclass
+class SeedInfo:
+    customer_ids: list[int] = field(default_factory=list)
+    show_ids: list[int] = field(default_factory=list)
+    avanue_ids: list[int] = field(default_factory=list)
+    enrollments: list[tuple[int, int]] = field(default_factory=list)
+
+
+def _insert_ids(db: Session, model, rows: list[dict], chunk_size: int = 1000) -> list[int]:
+    ids = []
+    for start in range(0, len(rows), chunk_size):
+        stmt = insert(model).returning(model.id, sort_by_parameter_order=True)
+        ids.extend(db.scalars(stmt, rows[start:start + chunk_size]))
+
+    return ids
+
+
+def seed(db: Session, customers: int, shows: int, avanues: int, enrollments: int, rng: random.Random) -> SeedInfo:
+    info = SeedInfo()
+    info.avanue_ids = _insert_ids(db, AvanueORM, [
+        {"name": f"bench avanue {i}", "availability": rng.random() < 0.8} for i in range(avanues)
+    ])
+    info.show_ids = _insert_ids(db, ShowORM, [
+        {
+            "title": f"bench show {i}",
+            "age_limit": rng.randint(0, 21),
+            "head_count": rng.randint(50, 500),
+            "avanue_id": rng.choice(info.avanue_ids) if info.avanue_ids and rng.random() < 0.7 else None,
+        }
+        for i in range(shows)
+    ])
+    info.customer_ids = _insert_ids(db, CustomerORM, [
+        {"name": f"bench customer {i}", "age": rng.randint(5, 90)} for i in range(customers)
+    ])
+
+    # head_count is the number of seats left, so seeded attendance does not consume it
+    pairs = set()
+    if info.customer_ids and info.show_ids:
+        target = min(enrollments, len(info.customer_ids) * len(info.show_ids))
+        while len(pairs) < target:
+            pairs.add((rng.choice(info.customer_ids), rng.choice(info.show_ids)))
+    info.enrollments = sorted(pairs)
+    rows = [{"customer_id": customer_id, "show_id": show_id} for customer_id, show_id in info.enrollments]
+    for start in range(0, len(rows), 1000):
+        db.execute(insert(customer_show), rows[start:start + 1000])
+
+    db.commit()
+
+    return info
+
+
+def add_customers(db: Session, count: int, age: int, prefix: str) -> list[int]:
+    ids = _insert_ids(db, CustomerORM, [{"name": f"{prefix} {i}", "age": age} for i in range(count)])
+    db.commit()
+
+    return ids
+
+
+def add_shows(db: Session, count: int, head_count: int, prefix: str, avanue_id: int | None = None) -> list[int]:
+    ids = _insert_ids(db, ShowORM, [
+        {"title": f"{prefix} {i}", "age_limit": 0, "head_count": head_count, "avanue_id": avanue_id} for i in range(count)
+    ])
+    db.commit()
+
+    return ids
+
+
+def add_avanues(db: Session, count: int, prefix: str) -> list[int]:
+    ids = _insert_ids(db, AvanueORM, [{"name": f"{prefix} {i}", "availability": True} for i in range(count)])
+    db.commit()
+
+    return ids
+
+
+def add_enrollments(db: Session, pairs: list[tuple[int, int]]):
+    if pairs:
+        db.execute(insert(customer_show), [{"customer_id": c, "show_id": s} for c, s in pairs])
+    db.commit()
+
+    return None
+
+
+def attendance(db: Session, show_id: int) -> tuple[int, int]:
+    head_count = db.scalar(select(ShowORM.head_count).where(ShowORM.id == show_id))
+    attendees = db.scalar(select(func.count()).select_from(customer_show).where(customer_show.c.show_id == show_id))
+
+    return head_count, attendees
@@ -0,0 +1,137 @@
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable, Hashable
+import settings
+
+
+class CacheBackend:
+    # called with the key whenever the backend drops an entry on its own (LRU or TTL)
+    on_evict: Callable[[Hashable], None] | None = None
+
+    def get(self, key: Hashable) -> Any | None:
+        raise NotImplementedError
+
+    def set(self, key: Hashable, value: Any):
+        raise NotImplementedError
+
+    def delete(self, key: Hashable):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        raise NotImplementedError
+
+
+class LRUTTLCache(CacheBackend):
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _evict(self, key: Hashable):
+        del self._entries[key]
+        self.evictions += 1
+        if self.on_evict is not None:
+            self.on_evict(key)
+
+    def get(self, key: Hashable):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                self._evict(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        if self.max_entries <= 0:
+            return None
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._evict(next(iter(self._entries)))
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "entries": len(self._entries)}
+
+
+# detail responses keyed by (entity type, id); a cached response embeds other entities (a show
+# lists its customers and avanue), so every entry records the keys it depends on and
+# invalidating a key drops its dependents as well
+class EntityCache:
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self.backend.on_evict = self._forget
+        self._dependents: defaultdict[Hashable, set] = defaultdict(set)
+        self._dependencies: dict[Hashable, tuple] = {}
+        self._lock = threading.RLock()
+        # bumped on every invalidation so a load racing with a write is not cached
+        self.generation = 0
+
+    def _forget(self, key: Hashable):
+        for dependency in self._dependencies.pop(key, ()):
+            dependents = self._dependents.get(dependency)
+            if dependents is not None:
+                dependents.discard(key)
+                if not dependents:
+                    del self._dependents[dependency]
+
+    def get(self, key: Hashable):
+        with self._lock:
+            return self.backend.get(key)
+
+    def set(self, key: Hashable, value: Any, depends_on: list[Hashable], generation: int):
+        with self._lock:
+            if generation != self.generation:
+                return None
+
+            self._forget(key)
+            self.backend.set(key, value)
+            self._dependencies[key] = tuple(depends_on)
+            for dependency in depends_on:
+                self._dependents[dependency].add(key)
+
+    def invalidate(self, *keys: Hashable):
+        with self._lock:
+            self.generation += 1
+            for key in keys:
+                for dependent in self._dependents.pop(key, set()):
+                    self.backend.delete(dependent)
+                    self._forget(dependent)
+                self.backend.delete(key)
+                self._forget(key)
+
+    def stats(self) -> dict:
+        return self.backend.stats()
+
+
+def detail_dependencies(kind: str, detail) -> list[tuple[str, int]]:
+    if kind == "customer":
+        shows = [("show", show.id) for show in detail.show_list]
+        return shows + [("avanue", show.avanue.id) for show in detail.show_list if show.avanue is not None]
+    if kind == "show":
+        customers = [("customer", customer.id) for customer in detail.customer_list]
+        return customers + ([("avanue", detail.avanue.id)] if detail.avanue is not None else [])
+    return [("show", show.id) for show in detail.show_list]
+
+
+entity_cache = EntityCache(LRUTTLCache(settings.CACHE_MAX_ENTRIES, settings.CACHE_TTL_SECONDS))
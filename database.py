@@ -1,20 +1,141 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, make_url
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import sessionmaker, Session
+from starlette.concurrency import run_in_threadpool
+from fastapi import Request, Response
 from models import Base
-import os
-from dotenv import load_dotenv
+from replicas import ReplicaSet
+import settings
 
-load_dotenv()
-database_url = os.getenv("DATABASE_URL")
+database_url = settings.DATABASE_URL
 
-engine = create_engine(url=database_url, echo=True)
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
-Base.metadata.create_all(engine)
+# an async driver in the url (sqlite+aiosqlite, postgresql+asyncpg) switches the app to AsyncSession
+async_mode = make_url(database_url).get_dialect().is_async
 
-def get_db():
+# writes return the final row state with RETURNING, so sessions keep committed objects
+# instead of expiring them and reading them again on the next attribute access
+if async_mode:
+    async_engine = create_async_engine(url=database_url, echo=settings.DATABASE_ECHO)
+    # only for events and pool inspection, blocking calls on it are not allowed in async mode
+    engine = async_engine.sync_engine
+    SessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+else:
+    engine = create_engine(url=database_url, echo=settings.DATABASE_ECHO)
+    SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, expire_on_commit=False)
+    Base.metadata.create_all(engine)
+
+# replica sessions are marked so callers know their reads may lag behind the primary
+if async_mode:
+    replica_engines = [create_async_engine(url=url, echo=settings.DATABASE_ECHO) for url in settings.DATABASE_REPLICA_URLS]
+    replicas = ReplicaSet(
+        [replica.sync_engine for replica in replica_engines],
+        [async_sessionmaker(bind=replica, autoflush=False, expire_on_commit=False, info={"replica": True}) for replica in replica_engines],
+        settings.REPLICA_EJECT_SECONDS,
+    )
+else:
+    replica_engines = [create_engine(url=url, echo=settings.DATABASE_ECHO) for url in settings.DATABASE_REPLICA_URLS]
+    replicas = ReplicaSet(
+        replica_engines,
+        [sessionmaker(bind=replica, autoflush=False, autocommit=False, expire_on_commit=False, info={"replica": True}) for replica in replica_engines],
+        settings.REPLICA_EJECT_SECONDS,
+    )
+
+# set on every write response while replicas are configured; reads carrying it stay on the primary
+PRIMARY_READS_COOKIE = "primary_reads"
+
+AnySession = Session | AsyncSession
+
+async def init_db():
+    if async_mode:
+        async with async_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+def _remember_write(response: Response):
+    if replicas.engines:
+        response.set_cookie(PRIMARY_READS_COOKIE, "1", max_age=settings.READ_YOUR_WRITES_SECONDS, httponly=True)
+
+def _replica_factories(request: Request):
+    if request.cookies.get(PRIMARY_READS_COOKIE):
+        return
+    # picked lazily: a replica that fails to connect is ejected by its error handler before the next pick
+    for _ in replicas.engines:
+        yield replicas.choose()
+
+def get_sync_db(response: Response):
+    _remember_write(response)
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
+async def get_async_db(response: Response):
+    _remember_write(response)
+    async with SessionLocal() as db:
+        yield db
+
+# connects up front, so an unreachable replica costs a fallback instead of a failed request
+def _open_sync_read_session(request: Request):
+    for factory in _replica_factories(request):
+        if factory is None:
+            break
+        db = factory()
+        try:
+            db.connection()
+            return db
+        except OperationalError:
+            db.close()
+    return SessionLocal()
+
+async def _open_async_read_session(request: Request):
+    for factory in _replica_factories(request):
+        if factory is None:
+            break
+        db = factory()
+        try:
+            await db.connection()
+            return db
+        except OperationalError:
+            await db.close()
+    return SessionLocal()
+
+def get_sync_read_db(request: Request):
+    db = _open_sync_read_session(request)
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_read_db(request: Request):
+    async with await _open_async_read_session(request) as db:
+        yield db
+
+# get_db always talks to the primary, get_read_db may be served by a replica
+get_db = get_async_db if async_mode else get_sync_db
+get_read_db = get_async_read_db if async_mode else get_sync_read_db
+
+async def run_in_session(db: AnySession, fn, *args):
+    # repositories and services are plain sync code; an AsyncSession runs them through
+    # run_sync on its greenlet, a Session runs them on the threadpool
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args)
+    return await run_in_threadpool(fn, db, *args)
+
+# a session of its own for work outside the request's session, e.g. from middleware or long
+# responses that must not hold a pooled connection while they run
+async def run_in_new_session(fn, *args):
+    if async_mode:
+        async with SessionLocal() as db:
+            return await run_in_session(db, fn, *args)
+
+    # opened and closed on the worker thread: if the caller is cancelled the thread keeps running,
+    # and closing the session from the event loop would use its connection from two threads
+    return await run_in_threadpool(_run_in_sync_session, fn, *args)
+
+def _run_in_sync_session(fn, *args):
+    db = SessionLocal()
+    try:
+        return fn(db, *args)
+    finally:
+        db.close()
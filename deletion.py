@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from database import run_in_new_session
+from services import CRUDServices
+import settings
+
+logger = logging.getLogger("ticketing.jobs")
+
+# finished jobs kept for the status endpoint
+MAX_FINISHED_JOBS = 1000
+
+# per kind: the service method that removes one chunk, returning (rows processed, finished)
+CHUNKS = {
+    "customer": lambda db, id, size: CRUDServices.CustomerService(db).delete_customer_chunk(id, size),
+    "avanue": lambda db, id, size: CRUDServices.AvanueService(db).delete_avanue_chunk(id, size),
+}
+
+
+@dataclass
+class DeletionJob:
+    id: str
+    kind: str
+    target_id: int
+    total: int
+    status: str = "running"
+    processed: int = 0
+    error: str | None = None
+    created_at: float = 0.0
+    finished_at: float | None = None
+
+
+# runs deletes in the background on the event loop, one chunk per short-lived session, so no
+# transaction holds locks on more than a chunk of rows and enrollments run in between chunks
+class DeletionJobs:
+    def __init__(self, chunk_size: int):
+        self.chunk_size = chunk_size
+        self.jobs: OrderedDict[str, DeletionJob] = OrderedDict()
+        self._running: dict[tuple[str, int], DeletionJob] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    # a delete of something that is already being deleted returns the running job
+    def start(self, kind: str, target_id: int, total: int) -> DeletionJob:
+        running = self._running.get((kind, target_id))
+        if running is not None:
+            return running
+
+        job = DeletionJob(uuid.uuid4().hex, kind, target_id, total, created_at=time.time())
+        self.jobs[job.id] = job
+        self._running[(kind, target_id)] = job
+        self._trim()
+
+        task = asyncio.get_running_loop().create_task(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        return job
+
+    def get(self, job_id: str) -> DeletionJob | None:
+        return self.jobs.get(job_id)
+
+    async def drain(self):
+        while self._tasks:
+            await asyncio.gather(*self._tasks)
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished_at is not None]
+        for job_id in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del self.jobs[job_id]
+
+    async def _run(self, job: DeletionJob):
+        chunk = CHUNKS[job.kind]
+        try:
+            finished = False
+            while not finished:
+                processed, finished = await run_in_new_session(chunk, job.target_id, self.chunk_size)
+                job.processed += processed
+                # let waiting requests have the database between chunks
+                await asyncio.sleep(0)
+            job.status = "done"
+        except Exception as e:
+            logger.exception("Deleting %s %d failed", job.kind, job.target_id)
+            job.status = "failed"
+            job.error = f"{e}"
+        finally:
+            job.finished_at = time.time()
+            del self._running[(job.kind, job.target_id)]
+
+
+deletion_jobs = DeletionJobs(settings.DELETE_CHUNK_SIZE)
@@ -0,0 +1,129 @@
+import hashlib
+from functools import lru_cache
+from typing import NamedTuple
+from pydantic import TypeAdapter, create_model
+from sqlalchemy.orm import load_only, selectinload, joinedload
+from models import CustomerORM, ShowORM, AvanueORM
+import schemas
+
+# relationships below the top-level entity a request may expand, e.g. show_list.avanue is 2
+MAX_EXPAND_DEPTH = 2
+
+MODELS = {"customer": CustomerORM, "show": ShowORM, "avanue": AvanueORM}
+# the plain columns of each entity take their types and descriptions from the read-list schemas
+COLUMNS = {
+    "customer": schemas.CustomerReadList.model_fields,
+    "show": schemas.ShowReadList.model_fields,
+    "avanue": schemas.AvanueReadList.model_fields,
+}
+# relationship name -> (related entity, is a collection)
+RELATIONS = {
+    "customer": {"show_list": ("show", True)},
+    "show": {"customer_list": ("customer", True), "avanue": ("avanue", False)},
+    "avanue": {"show_list": ("show", True)},
+}
+
+
+class Selection(NamedTuple):
+    columns: tuple[str, ...]
+    relations: tuple[tuple[str, "Selection"], ...]
+
+
+def _node(tree: dict, kind: str, path: list[str]) -> tuple[dict, str]:
+    if len(path) > MAX_EXPAND_DEPTH:
+        raise ValueError(f"{'.'.join(path)} expands more than {MAX_EXPAND_DEPTH} levels.")
+    for name in path:
+        if name not in RELATIONS[kind]:
+            raise ValueError(f"{name} is not a relationship of {kind}; expected one of {', '.join(RELATIONS[kind])}.")
+        kind = RELATIONS[kind][name][0]
+        tree = tree["relations"].setdefault(name, {"columns": None, "relations": {}})
+    return tree, kind
+
+
+def _freeze(tree: dict, kind: str) -> Selection:
+    # id is always returned, it identifies the row and is the page cursor
+    chosen = tree["columns"]
+    columns = tuple(name for name in COLUMNS[kind] if chosen is None or name == "id" or name in chosen)
+    relations = tuple(
+        (name, _freeze(child, RELATIONS[kind][name][0])) for name, child in sorted(tree["relations"].items())
+    )
+    return Selection(columns, relations)
+
+
+def _paths(value: str | None) -> list[list[str]]:
+    return [path.strip().split(".") for path in (value or "").split(",") if path.strip()]
+
+
+# fields lists columns, with dotted paths for columns of expanded relationships (customer_list.name);
+# naming a relationship in fields expands it. expand lists relationships returned with all their columns
+@lru_cache(maxsize=1024)
+def parse(kind: str, fields: str | None, expand: str | None) -> Selection:
+    tree = {"columns": None, "relations": {}}
+    for path in _paths(expand):
+        _node(tree, kind, path)
+
+    for path in _paths(fields):
+        node, node_kind = _node(tree, kind, path[:-1])
+        name = path[-1]
+        if name in RELATIONS[node_kind]:
+            _node(tree, kind, path)
+        elif name in COLUMNS[node_kind]:
+            node["columns"] = (node["columns"] or set()) | {name}
+        else:
+            raise ValueError(f"{name} is not a field of {node_kind}; expected one of {', '.join([*COLUMNS[node_kind], *RELATIONS[node_kind]])}.")
+
+    return _freeze(tree, kind)
+
+
+# loads the selected columns only and eager loads the selected relationships, collections with
+# one IN query each and many-to-one relationships joined, like the detail_options of the repositories
+def loader_options(kind: str, selection: Selection) -> list:
+    model = MODELS[kind]
+    options = [load_only(*[getattr(model, name) for name in selection.columns])]
+    for name, child in selection.relations:
+        related, many = RELATIONS[kind][name]
+        loader = selectinload(getattr(model, name)) if many else joinedload(getattr(model, name))
+        options.append(loader.options(*loader_options(related, child)))
+    return options
+
+
+@lru_cache(maxsize=1024)
+def response_model(kind: str, selection: Selection):
+    definitions = {name: (COLUMNS[kind][name].annotation, COLUMNS[kind][name]) for name in selection.columns}
+    for name, child in selection.relations:
+        related, many = RELATIONS[kind][name]
+        nested = response_model(related, child)
+        definitions[name] = (list[nested], []) if many else (nested | None, None)
+    return create_model(f"{kind.capitalize()}Fields", __base__=schemas.Base, **definitions)
+
+
+# validates and serializes a page of the projection; building it compiles the core schema,
+# so it is cached like the response model
+@lru_cache(maxsize=1024)
+def page_adapter(kind: str, selection: Selection) -> TypeAdapter:
+    return TypeAdapter(list[response_model(kind, selection)])
+
+
+# every table the projection reads, their versions make up the ETag of a page
+def tables(kind: str, selection: Selection) -> set[str]:
+    names = {MODELS[kind].__tablename__}
+    for name, child in selection.relations:
+        names |= tables(RELATIONS[kind][name][0], child)
+    return names
+
+
+# every relationship path of the projection as (relationship, related model) steps from kind,
+# the versions along each path make up the ETag of a detail response
+@lru_cache(maxsize=1024)
+def relation_paths(kind: str, selection: Selection, prefix: tuple = ()) -> tuple:
+    paths = ()
+    for name, child in selection.relations:
+        related = RELATIONS[kind][name][0]
+        path = (*prefix, (name, MODELS[related]))
+        paths += (path, *relation_paths(related, child, path))
+    return paths
+
+
+# part of the ETag, so every projection of an entity is a representation of its own
+def tag(selection: Selection) -> str:
+    return hashlib.blake2b(repr(selection).encode(), digest_size=6).hexdigest()
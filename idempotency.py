@@ -0,0 +1,166 @@
+import asyncio
+import hashlib
+import json
+import time
+from dataclasses import dataclass
+from cache import LRUTTLCache
+from database import run_in_new_session
+from repositories import IdempotencyKeyRepository
+import settings
+
+HEADER = b"idempotency-key"
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+
+@dataclass
+class StoredResponse:
+    fingerprint: str
+    status: int
+    headers: list[tuple[bytes, bytes]]
+    body: bytes
+
+
+class IdempotencyStore:
+    async def get(self, key: str) -> StoredResponse | None:
+        raise NotImplementedError
+
+    async def set(self, key: str, response: StoredResponse):
+        raise NotImplementedError
+
+
+class MemoryIdempotencyStore(IdempotencyStore):
+    def __init__(self, max_entries: int, ttl: float):
+        self.entries = LRUTTLCache(max_entries, ttl)
+
+    async def get(self, key: str):
+        return self.entries.get(key)
+
+    async def set(self, key: str, response: StoredResponse):
+        self.entries.set(key, response)
+
+
+# shared by every process on the database; expired rows are purged every purge_every saves
+class DatabaseIdempotencyStore(IdempotencyStore):
+    def __init__(self, ttl: float, purge_every: int = 1000):
+        self.ttl = ttl
+        self.purge_every = purge_every
+        self._saves = 0
+
+    async def get(self, key: str):
+        def load(db):
+            row = IdempotencyKeyRepository(db).get(key, time.time() - self.ttl)
+            if row is None:
+                return None
+            headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in json.loads(row.headers)]
+            return StoredResponse(row.fingerprint, row.status, headers, row.body)
+
+        return await run_in_new_session(load)
+
+    async def set(self, key: str, response: StoredResponse):
+        self._saves += 1
+        purge = self._saves % self.purge_every == 0
+
+        def save(db):
+            repo = IdempotencyKeyRepository(db)
+            repo.save({
+                "key": key,
+                "fingerprint": response.fingerprint,
+                "status": response.status,
+                "headers": json.dumps([(name.decode("latin-1"), value.decode("latin-1")) for name, value in response.headers]),
+                "body": response.body,
+                "created_at": time.time(),
+            })
+            if purge:
+                repo.purge(time.time() - self.ttl)
+            db.commit()
+
+        await run_in_new_session(save)
+
+
+def make_store() -> IdempotencyStore:
+    if settings.IDEMPOTENCY_BACKEND == "database":
+        return DatabaseIdempotencyStore(settings.IDEMPOTENCY_TTL_SECONDS)
+    return MemoryIdempotencyStore(settings.IDEMPOTENCY_MAX_ENTRIES, settings.IDEMPOTENCY_TTL_SECONDS)
+
+
+async def _send_json(send, status: int, detail: str):
+    body = json.dumps({"detail": detail}).encode()
+    await send({"type": "http.response.start", "status": status, "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+# replays the stored response of a write request whose Idempotency-Key was seen before. A retry
+# arriving while the first request still runs waits for it instead of running again; 5xx
+# responses are not stored, so the request can be retried for real
+class IdempotencyMiddleware:
+    def __init__(self, app, store: IdempotencyStore | None = None):
+        self.app = app
+        self.store = store or make_store()
+        self._in_flight: dict[str, asyncio.Future] = {}
+
+    async def __call__(self, scope, receive, send):
+        key = dict(scope.get("headers", [])).get(HEADER) if scope["type"] == "http" else None
+        if key is None or scope["method"] not in WRITE_METHODS:
+            return await self.app(scope, receive, send)
+
+        key = key.decode("latin-1")
+        digest = hashlib.sha256(f"{scope['method']} {scope['path']}?{scope['query_string'].decode('latin-1')}\n".encode())
+
+        while True:
+            stored = await self.store.get(key)
+            if stored is not None:
+                return await self._replay(stored, digest, receive, send)
+
+            in_flight = self._in_flight.get(key)
+            if in_flight is None:
+                break
+            try:
+                await asyncio.wait_for(asyncio.shield(in_flight), settings.IDEMPOTENCY_WAIT_SECONDS)
+            except asyncio.TimeoutError:
+                return await _send_json(send, 409, "A request with this Idempotency-Key is still in progress.")
+
+        self._in_flight[key] = asyncio.get_running_loop().create_future()
+        try:
+            await self._run(key, digest, scope, receive, send)
+        finally:
+            self._in_flight.pop(key).set_result(None)
+
+    async def _run(self, key: str, digest, scope, receive, send):
+        status = 500
+        headers = []
+        body = []
+
+        async def hashing_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                digest.update(message.get("body", b""))
+            return message
+
+        async def capturing_send(message):
+            nonlocal status, headers
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                body.append(message.get("body", b""))
+            await send(message)
+
+        await self.app(scope, hashing_receive, capturing_send)
+        if status < 500:
+            await self.store.set(key, StoredResponse(digest.hexdigest(), status, headers, b"".join(body)))
+
+    async def _replay(self, stored: StoredResponse, digest, receive, send):
+        # the body of the retry has to match the first request's, so it is read and hashed
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                return None
+            digest.update(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+
+        if digest.hexdigest() != stored.fingerprint:
+            return await _send_json(send, 422, "This Idempotency-Key was already used for a different request.")
+
+        await send({"type": "http.response.start", "status": stored.status, "headers": stored.headers + [(b"idempotent-replayed", b"true")]})
+        await send({"type": "http.response.body", "body": stored.body})
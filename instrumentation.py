@@ -0,0 +1,210 @@
+import logging
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import settings
+
+logger = logging.getLogger("ticketing.sql")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+# parameter lists of expanding IN clauses differ per call but are the same statement shape
+_IN_LIST = re.compile(r"\((?:\s*(?:\?|%s|%\(\w+\)s|\$\d+|:\w+)\s*,)+\s*(?:\?|%s|%\(\w+\)s|\$\d+|:\w+)\s*\)")
+
+
+def statement_shape(statement: str) -> str:
+    return _IN_LIST.sub("(...)", statement)
+
+
+@dataclass
+class RequestStats:
+    statements: int = 0
+    db_time: float = 0.0
+    shapes: Counter = field(default_factory=Counter)
+
+    def repeated_shape(self) -> tuple[str, int] | None:
+        if not self.shapes:
+            return None
+        shape, count = self.shapes.most_common(1)[0]
+        return (shape, count) if count > settings.N_PLUS_ONE_THRESHOLD else None
+
+
+_request_stats: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += 1
+        self.sum += value
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests: Counter = Counter()
+        self.n_plus_one: Counter = Counter()
+        self.durations: defaultdict = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.db_time: defaultdict = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.queries: defaultdict = defaultdict(lambda: Histogram(QUERY_BUCKETS))
+        self.pool_wait = Histogram(LATENCY_BUCKETS)
+        self.pool = None
+
+    def observe_request(self, method: str, route: str, status: int, duration: float, stats: RequestStats):
+        with self._lock:
+            self.requests[(method, route, status)] += 1
+            self.durations[(method, route)].observe(duration)
+            self.db_time[(method, route)].observe(stats.db_time)
+            self.queries[(method, route)].observe(stats.statements)
+            if stats.repeated_shape() is not None:
+                self.n_plus_one[(method, route)] += 1
+
+    def observe_pool_wait(self, seconds: float):
+        with self._lock:
+            self.pool_wait.observe(seconds)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            lines += _counter("http_requests_total", "Requests by route and status.", {
+                (("method", m), ("route", r), ("status", str(s))): v for (m, r, s), v in self.requests.items()
+            })
+            lines += _counter("sql_n_plus_one_requests_total", "Requests that repeated one statement shape too often.", {
+                (("method", m), ("route", r)): v for (m, r), v in self.n_plus_one.items()
+            })
+            lines += _histograms("http_request_duration_seconds", "Request latency by route.", self.durations)
+            lines += _histograms("sql_request_db_seconds", "Time spent in the database per request.", self.db_time)
+            lines += _histograms("sql_request_statements", "SQL statements per request.", self.queries)
+            lines += _histograms("sql_pool_wait_seconds", "Time spent waiting for a pooled connection.", {(): self.pool_wait})
+
+        pool = self.pool
+        if pool is not None and hasattr(pool, "checkedout"):
+            lines += _gauge("sql_pool_size", "Configured pool size.", pool.size())
+            lines += _gauge("sql_pool_checked_out", "Connections currently checked out.", pool.checkedout())
+            lines += _gauge("sql_pool_checked_in", "Idle connections in the pool.", pool.checkedin())
+            lines += _gauge("sql_pool_overflow", "Connections opened beyond the pool size.", max(pool.overflow(), 0))
+
+        return "\n".join(lines) + "\n"
+
+
+def _labels(pairs) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+def _counter(name: str, help: str, values: dict) -> list[str]:
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} counter"]
+    return lines + [f"{name}{_labels(labels)} {value}" for labels, value in values.items()]
+
+
+def _gauge(name: str, help: str, value) -> list[str]:
+    return [f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {value}"]
+
+
+def _histograms(name: str, help: str, histograms: dict) -> list[str]:
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} histogram"]
+    for key, histogram in histograms.items():
+        labels = tuple(zip(("method", "route"), key))
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {count}")
+        lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {histogram.total}")
+        lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+        lines.append(f"{name}_count{_labels(labels)} {histogram.total}")
+    return lines
+
+
+metrics = Metrics()
+
+
+def instrument_engine(engine: Engine, pool_metrics: bool = True):
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.db_time += elapsed
+            stats.shapes[statement_shape(statement)] += 1
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+
+    if not pool_metrics:
+        return None
+
+    # the pool has no event before a checkout starts waiting, so time the checkout itself
+    pool = engine.pool
+    connect = pool.connect
+
+    def timed_connect():
+        started = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            metrics.observe_pool_wait(time.perf_counter() - started)
+
+    pool.connect = timed_connect
+    metrics.pool = pool
+
+
+class SQLInstrumentationMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        status = 500
+
+        # a response with a body but without content-length is streamed (NDJSON lists, exports, seat
+        # events) and runs its queries after the headers are sent, so it gets no counts and only
+        # shows up on /metrics
+        async def send_with_stats(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                if status in (204, 304) or any(name.lower() == b"content-length" for name, _ in headers):
+                    headers.append((b"x-query-count", str(stats.statements).encode()))
+                    headers.append((b"x-db-time-ms", f"{stats.db_time * 1000:.2f}".encode()))
+                    repeated = stats.repeated_shape()
+                    if repeated is not None:
+                        headers.append((b"x-n-plus-one", str(repeated[1]).encode()))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            _request_stats.reset(token)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            metrics.observe_request(scope["method"], route, status, time.perf_counter() - started, stats)
+            repeated = stats.repeated_shape()
+            if repeated is not None:
+                logger.warning("%s %s ran the same statement %d times (possible N+1): %s", scope["method"], route, repeated[1], repeated[0])
@@ -1,143 +1,530 @@
-from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy.orm import Session
-from database import get_db
+from contextlib import asynccontextmanager
+from typing import Literal
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from starlette.concurrency import iterate_in_threadpool
+import orjson
+import database
+from database import get_db, get_read_db, SessionLocal, AnySession, async_mode, init_db, run_in_session, run_in_new_session
 from services import CRUDServices, GeneralServices
-from repositories import CustomerRepository, ShowRepository, AvanueRepository
+from repositories import CustomerRepository, ShowRepository, AvanueRepository, TableVersionRepository, StatsRepository
+from pagination import encode_cursor, decode_cursor
+from cache import entity_cache, detail_dependencies
+from seatgate import ShowSoldOut
+from seathub import seat_hub
+from instrumentation import SQLInstrumentationMiddleware, instrument_engine, metrics
+from idempotency import IdempotencyMiddleware
+from admission import AdmissionMiddleware, admission_control
+from deletion import deletion_jobs
 import schemas
+import settings
+import transfer
+import fieldsets
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await init_db()
+    yield
+
+app = FastAPI(lifespan=lifespan)
+# innermost: replayed idempotent responses and shed requests never take a slot or touch the database
+if settings.ADMISSION_CONTROL:
+    app.add_middleware(AdmissionMiddleware)
+# inside the SQL instrumentation, so replayed responses are counted (with no statements) as well
+app.add_middleware(IdempotencyMiddleware)
+app.add_middleware(SQLInstrumentationMiddleware)
+instrument_engine(database.engine)
+for replica in database.replicas.engines:
+    instrument_engine(replica, pool_metrics=False)
+
+PAGE_LIMIT = Query(default=100, ge=1, le=1000, description="Maximum number of rows in the page.")
+PAGE_AFTER = Query(default=None, description="Opaque cursor from the X-Next-Cursor header of the previous page.")
+PAGE_STREAM = Query(default=False, description="Stream every row after the cursor as NDJSON instead of a page.")
+FIELDS = Query(default=None, description="Comma separated fields to return, dotted for related entities, e.g. title,customer_list.name.")
+EXPAND = Query(default=None, description="Comma separated relationships to return with all their fields, e.g. show_list.avanue.")
+STREAM_BATCH_SIZE = 500
+TRANSFER_ENTITY = Literal["customers", "shows", "avanues", "enrollments"]
+TRANSFER_FORMAT = Query(default="ndjson", description="csv (with a header row) or ndjson.")
+BATCH_IDS = Query(description="Comma separated ids, e.g. 1,2,3.")
+BATCH_LIMIT = 1000
+SEAT_EVENTS_KEEPALIVE_SECONDS = 15
+MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+SHOW_SORT = Literal["id", "-id", "title", "-title", "age_limit", "-age_limit", "head_count", "-head_count"]
+
+
+def _dump(schema, row):
+    # validate while the session is still usable, lazy loads cannot run after an async endpoint returns
+    return schema.model_validate(row) if row is not None else None
+
+def _dump_json(schema, row):
+    return schema.model_validate(row).model_dump_json().encode() if row is not None else None
+
+def _after_id(after: str | None):
+    if after is None:
+        return None
+    try:
+        return int(decode_cursor(after)[0])
+    except (ValueError, TypeError) as e:
+        raise HTTPException(400, f"{e}")
+
+def _search_after(after: str | None):
+    if after is None:
+        return None
+    try:
+        value, id = decode_cursor(after)
+        return value, int(id)
+    except (ValueError, TypeError):
+        raise HTTPException(400, "Invalid pagination cursor.")
+
+def _sync_batches(repository, method: str, encode, *args):
+    db = SessionLocal()
+    try:
+        for batch in getattr(repository(db), method)(*args):
+            yield encode(batch)
+    finally:
+        db.close()
+
+# streams the batches of a repository generator method, or of its `<method>_async` twin in async mode
+async def _stream(repository, method: str, encode, *args):
+    if not async_mode:
+        async for chunk in iterate_in_threadpool(_sync_batches(repository, method, encode, *args)):
+            yield chunk
+        return
+
+    async with SessionLocal() as db:
+        async for batch in getattr(repository(db), method + "_async")(*args):
+            yield encode(batch)
+
+def _ndjson(schema):
+    return lambda batch: "".join(schema.model_validate(row).model_dump_json() + "\n" for row in batch)
+
+def _ndjson_rows(batch):
+    return b"".join(orjson.dumps(row._asdict(), option=orjson.OPT_APPEND_NEWLINE) for row in batch)
+
+async def _export_rows(entity: str, format: str):
+    repository, method, _ = transfer.EXPORTS[entity]
+    if format == "csv":
+        yield transfer.csv_header(entity)
+    async for chunk in _stream(repository, method, transfer.encoder(entity, format), STREAM_BATCH_SIZE):
+        yield chunk
+
+def _batch_ids(ids: str) -> list[int]:
+    try:
+        requested = list(dict.fromkeys(int(id) for id in ids.split(",") if id.strip()))
+    except ValueError:
+        raise HTTPException(400, "ids must be a comma separated list of integers.")
+    if not requested or len(requested) > BATCH_LIMIT:
+        raise HTTPException(400, f"Between 1 and {BATCH_LIMIT} ids are allowed.")
+    return requested
+
+async def _batch(ids: str, repository, schema, db: AnySession):
+    requested = _batch_ids(ids)
+    items = await run_in_session(db, lambda s: [schema.model_validate(row) for row in repository(s).get_many(requested)])
+    found = {item.id for item in items}
+    return {"items": items, "missing": [id for id in requested if id not in found]}
+
+async def _seat_events(subscription):
+    try:
+        while True:
+            changes = await subscription.changes(SEAT_EVENTS_KEEPALIVE_SECONDS)
+            if not changes:
+                yield ": keep-alive\n\n"
+                continue
+            yield "".join(
+                "event: seats\ndata: " + orjson.dumps({"show_id": show_id, "head_count": head_count}).decode() + "\n\n"
+                for show_id, head_count in changes.items()
+            )
+    finally:
+        seat_hub.unsubscribe(subscription)
+
+def _etag(*parts) -> str:
+    return '"' + "-".join(str(part) for part in parts) + '"'
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return False
+    return header.strip() == "*" or etag in (tag.strip() for tag in header.split(","))
+
+def _not_modified(etag: str):
+    return Response(status_code=304, headers={"ETag": etag})
+
+# the (kind, selection) of a sparse fieldset, None when the client asked for the default representation
+def _projection(kind: str, fields: str | None, expand: str | None):
+    if fields is None and expand is None:
+        return None
+    try:
+        return kind, fieldsets.parse(kind, fields, expand)
+    except ValueError as e:
+        raise HTTPException(400, f"{e}")
+
+# a projection is not cached: only the requested columns and relationships are loaded and serialized
+async def _sparse_detail(id: int, repository, projection, db: AnySession, request: Request):
+    kind, selection = projection
+    paths = fieldsets.relation_paths(kind, selection)
+    version_key = await run_in_session(db, lambda s: repository(s).get_projection_version_key(id, paths))
+    if version_key is None:
+        raise HTTPException(404, f"{kind.capitalize()} {id} is not in the repository.")
+
+    etag = _etag(kind, id, *version_key, fieldsets.tag(selection))
+    if _etag_matches(request, etag):
+        return _not_modified(etag)
+
+    model = fieldsets.response_model(kind, selection)
+    options = fieldsets.loader_options(kind, selection)
+    body = await run_in_session(db, lambda s: _dump_json(model, repository(s).get_detail(id, options)))
+    if body is None:
+        raise HTTPException(404, f"{kind.capitalize()} {id} is not in the repository.")
+
+    return Response(body, media_type="application/json", headers={"ETag": etag})
+
+async def _cached_detail(kind: str, id: int, repository, schema, db: AnySession, request: Request, response: Response):
+    key = (kind, id)
+    cached = entity_cache.get(key)
+    if cached is not None:
+        etag, row = cached
+        if _etag_matches(request, etag):
+            return _not_modified(etag)
+        response.headers["ETag"] = etag
+        return row
+
+    # the version key is read before the row, so a concurrent write can only make the etag too old
+    generation = entity_cache.generation
+    version_key = await run_in_session(db, lambda s: repository(s).get_version_key(id))
+    if version_key is None:
+        raise HTTPException(404, f"{kind.capitalize()} {id} is not in the repository.")
+
+    etag = _etag(kind, id, *version_key)
+    if _etag_matches(request, etag):
+        return _not_modified(etag)
+
+    row = await run_in_session(db, lambda s: _dump(schema, repository(s).get_detail(id)))
+    if row is None:
+        raise HTTPException(404, f"{kind.capitalize()} {id} is not in the repository.")
+
+    # a lagging replica could put a row back that a write has just invalidated
+    if not db.info.get("replica"):
+        entity_cache.set(key, (etag, row), detail_dependencies(kind, row), generation)
+    response.headers["ETag"] = etag
+    return row
+
+async def _list_rows(repository, schema, db: AnySession, request: Request, response: Response, limit: int, after: str | None, stream: bool, projection=None):
+    after_id = _after_id(after)
+    if projection is not None:
+        if stream:
+            raise HTTPException(400, "fields and expand cannot be combined with stream.")
+        return await _sparse_page(repository, projection, db, request, limit, after, after_id)
+    if stream and settings.LIST_FAST_PATH:
+        return StreamingResponse(_stream(repository, "stream_rows", _ndjson_rows, STREAM_BATCH_SIZE, after_id), media_type="application/x-ndjson")
+    if stream:
+        return StreamingResponse(_stream(repository, "stream_all", _ndjson(schema), STREAM_BATCH_SIZE, after_id), media_type="application/x-ndjson")
+
+    table = repository.table_name
+    version = await run_in_session(db, lambda s: TableVersionRepository(s).get(table))
+    etag = _etag(table, version, limit, after or "")
+    if _etag_matches(request, etag):
+        return _not_modified(etag)
+
+    if settings.LIST_FAST_PATH:
+        # plain column rows straight to JSON bytes, the selected columns are those of the read-list schema
+        rows = await run_in_session(db, lambda s: repository(s).get_page_rows(limit, after_id))
+        response = Response(orjson.dumps([row._asdict() for row in rows]), media_type="application/json")
+    else:
+        rows = await run_in_session(db, lambda s: [schema.model_validate(row) for row in repository(s).get_page(limit, after_id)])
+
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1].id)
+    response.headers["ETag"] = etag
+    return response if settings.LIST_FAST_PATH else rows
+
+
+async def _sparse_page(repository, projection, db: AnySession, request: Request, limit: int, after: str | None, after_id: int | None):
+    kind, selection = projection
+    tables = fieldsets.tables(kind, selection)
+    versions = await run_in_session(db, lambda s: TableVersionRepository(s).get_many(tables))
+    etag = _etag(repository.table_name, *versions, limit, after or "", fieldsets.tag(selection))
+    if _etag_matches(request, etag):
+        return _not_modified(etag)
+
+    page = fieldsets.page_adapter(kind, selection)
+    options = fieldsets.loader_options(kind, selection)
+    rows = await run_in_session(db, lambda s: page.validate_python(repository(s).get_page(limit, after_id, options)))
+
+    response = Response(page.dump_json(rows), media_type="application/json", headers={"ETag": etag})
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1].id)
+    return response
 
-app = FastAPI()
 
 @app.get("/", response_model=list[schemas.CustomerReadList])
-def get_customers(db: Session = Depends(get_db)):
-    rows = CustomerRepository(db).get_all()
+async def get_customers(request: Request, response: Response, limit: int = PAGE_LIMIT, after: str | None = PAGE_AFTER, stream: bool = PAGE_STREAM, fields: str | None = FIELDS, expand: str | None = EXPAND, db: AnySession = Depends(get_read_db)):
+    rows = await _list_rows(CustomerRepository, schemas.CustomerReadList, db, request, response, limit, after, stream, _projection("customer", fields, expand))
     return rows
 
 @app.get("/customer/{customer_id}", response_model=schemas.Customer)
-def get_customer(customer_id: int, db: Session = Depends(get_db)):
-    rows = CustomerRepository(db).get(customer_id)
+async def get_customer(customer_id: int, request: Request, response: Response, fields: str | None = FIELDS, expand: str | None = EXPAND, db: AnySession = Depends(get_read_db)):
+    projection = _projection("customer", fields, expand)
+    if projection is not None:
+        return await _sparse_detail(customer_id, CustomerRepository, projection, db, request)
+    rows = await _cached_detail("customer", customer_id, CustomerRepository, schemas.Customer, db, request, response)
     return rows
 
 @app.get("/shows/", response_model=list[schemas.ShowReadList])
-def get_shows(db: Session = Depends(get_db)):
-    rows = ShowRepository(db).get_all()
+async def get_shows(request: Request, response: Response, limit: int = PAGE_LIMIT, after: str | None = PAGE_AFTER, stream: bool = PAGE_STREAM, fields: str | None = FIELDS, expand: str | None = EXPAND, db: AnySession = Depends(get_read_db)):
+    rows = await _list_rows(ShowRepository, schemas.ShowReadList, db, request, response, limit, after, stream, _projection("show", fields, expand))
     return rows
 
+@app.get("/shows/search/", response_model=list[schemas.ShowReadList])
+async def search_shows(
+    limit: int = PAGE_LIMIT,
+    after: str | None = PAGE_AFTER,
+    sort: SHOW_SORT = Query(default="id", description="Column to sort by, prefixed with - for descending."),
+    title: str | None = Query(default=None, description="Case sensitive title prefix."),
+    eligible_for_customer: int | None = Query(default=None, description="Only shows this customer is old enough for and not enrolled in."),
+    min_seats: int | None = Query(default=None, ge=0, description="Only shows with at least this many seats left."),
+    avanue_available: bool | None = Query(default=None, description="Only shows assigned to an avanue with this availability."),
+    db: AnySession = Depends(get_read_db),
+):
+    after_key = _search_after(after)
+    column = sort.lstrip("-")
+    rows = await run_in_session(db, lambda s: ShowRepository(s).search(
+        limit, after_key, sort, title, eligible_for_customer, min_seats, avanue_available,
+    ))
+    response = Response(orjson.dumps([row._asdict() for row in rows]), media_type="application/json")
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(getattr(rows[-1], column), rows[-1].id)
+    return response
+
 @app.get("/show/{show_id}", response_model=schemas.Show)
-def get_show(show_id: int, db: Session = Depends(get_db)):
-    row = ShowRepository(db).get(show_id)
+async def get_show(show_id: int, request: Request, response: Response, fields: str | None = FIELDS, expand: str | None = EXPAND, db: AnySession = Depends(get_read_db)):
+    projection = _projection("show", fields, expand)
+    if projection is not None:
+        return await _sparse_detail(show_id, ShowRepository, projection, db, request)
+    row = await _cached_detail("show", show_id, ShowRepository, schemas.Show, db, request, response)
     return row
 
 @app.get("/avanues/", response_model=list[schemas.AvanueReadList])
-def get_avanues(db: Session = Depends(get_db)):
-    row = AvanueRepository(db).get_all()
+async def get_avanues(request: Request, response: Response, limit: int = PAGE_LIMIT, after: str | None = PAGE_AFTER, stream: bool = PAGE_STREAM, fields: str | None = FIELDS, expand: str | None = EXPAND, db: AnySession = Depends(get_read_db)):
+    row = await _list_rows(AvanueRepository, schemas.AvanueReadList, db, request, response, limit, after, stream, _projection("avanue", fields, expand))
     return row
 
 @app.get("/avanue/{avanue_id}", response_model=schemas.Avanue)
-def get_avanue(avanue_id: int, db: Session = Depends(get_db)):
-    row = AvanueRepository(db).get(avanue_id)
+async def get_avanue(avanue_id: int, request: Request, response: Response, fields: str | None = FIELDS, expand: str | None = EXPAND, db: AnySession = Depends(get_read_db)):
+    projection = _projection("avanue", fields, expand)
+    if projection is not None:
+        return await _sparse_detail(avanue_id, AvanueRepository, projection, db, request)
+    row = await _cached_detail("avanue", avanue_id, AvanueRepository, schemas.Avanue, db, request, response)
     return row
 
+@app.get("/customers/batch/", response_model=schemas.CustomerBatch)
+async def get_customer_batch(ids: str = BATCH_IDS, db: AnySession = Depends(get_read_db)):
+    rows = await _batch(ids, CustomerRepository, schemas.Customer, db)
+    return rows
+
+@app.get("/shows/batch/", response_model=schemas.ShowBatch)
+async def get_show_batch(ids: str = BATCH_IDS, db: AnySession = Depends(get_read_db)):
+    rows = await _batch(ids, ShowRepository, schemas.Show, db)
+    return rows
+
+@app.get("/avanues/batch/", response_model=schemas.AvanueBatch)
+async def get_avanue_batch(ids: str = BATCH_IDS, db: AnySession = Depends(get_read_db)):
+    rows = await _batch(ids, AvanueRepository, schemas.Avanue, db)
+    return rows
+
+@app.get("/shows/seats/stream/")
+async def stream_seats(ids: str = BATCH_IDS):
+    show_ids = _batch_ids(ids)
+    # subscribe before reading, so a change committed in between is not lost
+    subscription = seat_hub.subscribe(show_ids)
+    try:
+        rows = await run_in_new_session(lambda s: ShowRepository(s).get_seats(show_ids))
+    except Exception:
+        seat_hub.unsubscribe(subscription)
+        raise
+
+    missing = set(show_ids) - {row.id for row in rows}
+    if missing:
+        seat_hub.unsubscribe(subscription)
+        raise HTTPException(404, f"Shows {sorted(missing)} are not in the repository.")
+
+    for row in rows:
+        subscription.push(row.id, row.head_count, row.version)
+    return StreamingResponse(_seat_events(subscription), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/stats/show/{show_id}", response_model=schemas.ShowStats)
+async def get_show_stats(show_id: int, db: AnySession = Depends(get_read_db)):
+    row = await run_in_session(db, lambda s: StatsRepository(s).get_show(show_id))
+    if row is None:
+        raise HTTPException(404, f"Show {show_id} is not in the repository.")
+    return {"show_id": row.id, "sold": row.attendees, "remaining": row.head_count}
+
+@app.get("/stats/avanue/{avanue_id}", response_model=schemas.AvanueStats)
+async def get_avanue_stats(avanue_id: int, db: AnySession = Depends(get_read_db)):
+    row = await run_in_session(db, lambda s: StatsRepository(s).get_avanue(avanue_id))
+    if row is None:
+        raise HTTPException(404, f"Avanue {avanue_id} is not in the repository.")
+    return {"avanue_id": row.avanue_id, "shows": row.shows, "sold": row.attendees, "remaining": row.seats_remaining}
+
+@app.get("/cache/stats", response_model=schemas.CacheStats)
+async def get_cache_stats():
+    return entity_cache.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    lines = metrics.render() + "\n".join(admission_control.render()) + "\n"
+    return PlainTextResponse(lines, media_type="text/plain; version=0.0.4")
+
+@app.get("/admission/stats", response_model=dict[str, schemas.AdmissionStats])
+async def get_admission_stats():
+    return admission_control.stats()
+
+@app.get("/export/{entity}/")
+async def export_rows(entity: TRANSFER_ENTITY, format: Literal["csv", "ndjson"] = TRANSFER_FORMAT):
+    return StreamingResponse(_export_rows(entity, format), media_type=MEDIA_TYPES[format])
+
+@app.post("/import/{entity}/", response_model=schemas.ImportReport)
+async def import_rows(
+    entity: TRANSFER_ENTITY,
+    request: Request,
+    format: Literal["csv", "ndjson"] = TRANSFER_FORMAT,
+    chunk_size: int = Query(default=500, ge=1, le=5000, description="Rows validated and inserted per statement."),
+    db: AnySession = Depends(get_db),
+):
+    # the body is read chunk by chunk and every chunk is committed on its own, so a large
+    # upload never sits in memory and rows before a failure stay imported
+    report = schemas.ImportReport()
+    async for chunk in transfer.read_chunks(request.stream(), format, chunk_size):
+        inserted, errors = await run_in_session(db, transfer.import_chunk, entity, chunk)
+        report.received += len(chunk)
+        report.inserted += inserted
+        report.failed += len(errors)
+        room = transfer.MAX_REPORTED_ERRORS - len(report.errors)
+        report.errors += [schemas.ImportRowError(row=row, error=error) for row, error in errors[:max(room, 0)]]
+    return report
+
 @app.post("/add/customer/", response_model=schemas.Customer)
-def add_customer(customer: schemas.CustomerAdd, db: Session = Depends(get_db)):
+async def add_customer(customer: schemas.CustomerAdd, db: AnySession = Depends(get_db)):
     try:
-        result = CRUDServices.CustomerService(db).enroll_customer(customer)
+        result = await run_in_session(db, lambda s: _dump(schemas.Customer, CRUDServices.CustomerService(s).enroll_customer(customer)))
         return result
     except Exception as e:
         raise HTTPException(404, f"{e}")
 
 @app.post("/add/show/", response_model=schemas.Show)
-def add_show(show: schemas.ShowAdd, db: Session = Depends(get_db)):
+async def add_show(show: schemas.ShowAdd, db: AnySession = Depends(get_db)):
     try:
-        result = CRUDServices.ShowService(db).enroll_show(show)
+        result = await run_in_session(db, lambda s: _dump(schemas.Show, CRUDServices.ShowService(s).enroll_show(show)))
         return result
     except Exception as e:
         raise HTTPException(404, f"{e}")
 
 @app.post("/add/avanue/", response_model=schemas.Avanue)
-def add_avanue(avanue: schemas.AvanueAdd, db: Session = Depends(get_db)):
+async def add_avanue(avanue: schemas.AvanueAdd, db: AnySession = Depends(get_db)):
     try:
-        result = CRUDServices.AvanueService(db).enroll_avanue(avanue)
+        result = await run_in_session(db, lambda s: _dump(schemas.Avanue, CRUDServices.AvanueService(s).enroll_avanue(avanue)))
         return result
     except Exception as e:
         raise HTTPException(404, f"{e}")
 
 @app.post("/general_services/enroll_customer_to_show/", response_model=schemas.Message)
-def enroll_customer_to_show(customer_id: int, show_id: int, db: Session = Depends(get_db)):
+async def enroll_customer_to_show(customer_id: int, show_id: int, db: AnySession = Depends(get_db)):
     try:
-        result = GeneralServices(db).enroll_customer_to_show(customer_id, show_id)
+        result = await run_in_session(db, lambda s: GeneralServices(s).enroll_customer_to_show(customer_id, show_id))
+        return result
+    except ShowSoldOut as e:
+        raise HTTPException(409, f"{e}")
+    except Exception as e:
+        raise HTTPException(404, f"{e}")
+
+@app.post("/general_services/enroll_customers_to_show/", response_model=schemas.BulkEnrollmentResult)
+async def enroll_customers_to_show(enrollment: schemas.BulkEnrollmentAdd, db: AnySession = Depends(get_db)):
+    try:
+        result = await run_in_session(db, lambda s: GeneralServices(s).enroll_customers_to_show(enrollment.show_id, enrollment.customer_ids))
         return result
     except Exception as e:
         raise HTTPException(404, f"{e}")
 
 @app.post("/general_services/show_to_avanue/", response_model=schemas.Message)
-def enroll_show_to_avanue(show_id: int, avanue_id: int, db: Session = Depends(get_db)):
+async def enroll_show_to_avanue(show_id: int, avanue_id: int, db: AnySession = Depends(get_db)):
     try:
-        result = GeneralServices(db).enroll_show_to_avanue(show_id, avanue_id)
+        result = await run_in_session(db, lambda s: GeneralServices(s).enroll_show_to_avanue(show_id, avanue_id))
         return result
     except Exception as e:
         raise HTTPException(404, f"{e}")
 
 @app.patch("/update/customer/{customer_id}", response_model=schemas.Customer)
-def update_customer(id: int, customer: schemas.CustomerUpdate, db: Session = Depends(get_db)):
+async def update_customer(id: int, customer: schemas.CustomerUpdate, db: AnySession = Depends(get_db)):
     try:
-        result = CRUDServices.CustomerService(db).update_customer(id, customer)
+        result = await run_in_session(db, lambda s: _dump(schemas.Customer, CRUDServices.CustomerService(s).update_customer(id, customer)))
         return result
     except Exception as e:
         raise HTTPException(404, f"{e}")
 
 @app.patch("/update/show/{show_id}", response_model=schemas.Show)
-def update_show(id: int, show: schemas.ShowUpdate, db: Session = Depends(get_db)):
+async def update_show(id: int, show: schemas.ShowUpdate, db: AnySession = Depends(get_db)):
     try:
-        result = CRUDServices.ShowService(db).update_show(id, show)
+        result = await run_in_session(db, lambda s: _dump(schemas.Show, CRUDServices.ShowService(s).update_show(id, show)))
         return result
     except Exception as e:
         raise HTTPException(404, f"{e}")
 
 @app.patch("/update/avanue/{avanue_id}", response_model=schemas.Avanue)
-def update_avanue(id: int, avanue: schemas.AvanueUpdate, db: Session = Depends(get_db)):
+async def update_avanue(id: int, avanue: schemas.AvanueUpdate, db: AnySession = Depends(get_db)):
     try:
-        result = CRUDServices.AvanueService(db).update_avanue(id, avanue)
+        result = await run_in_session(db, lambda s: _dump(schemas.Avanue, CRUDServices.AvanueService(s).update_avanue(id, avanue)))
         return result
     except Exception as e:
         raise HTTPException(404, f"{e}")
 
-@app.delete("/delete/customer/{customer_id}", response_model=schemas.Message)
-def delete_customer(customer_id: int, db: Session = Depends(get_db)):
+# customers and avanues are deleted by a background job, its status is served on /jobs/{id}
+@app.delete("/delete/customer/{customer_id}", response_model=schemas.DeletionJob, status_code=202)
+async def delete_customer(customer_id: int, response: Response, db: AnySession = Depends(get_db)):
     try:
-        result = CRUDServices.CustomerService(db).delete_customer(customer_id)
-        return result
+        total = await run_in_session(db, lambda s: CRUDServices.CustomerService(s).prepare_delete_customer(customer_id))
     except Exception as e:
         raise HTTPException(404, f"{e}")
+    job = deletion_jobs.start("customer", customer_id, total)
+    response.headers["Location"] = f"/jobs/{job.id}"
+    return job
     
 @app.delete("/delete/show/{show_id}", response_model=schemas.Message)
-def delete_show(show_id: int, db: Session = Depends(get_db)):
+async def delete_show(show_id: int, db: AnySession = Depends(get_db)):
     try:
-        result = CRUDServices.ShowService(db).delete_show(show_id)
+        result = await run_in_session(db, lambda s: CRUDServices.ShowService(s).delete_show(show_id))
         return result
     except Exception as e:
         raise HTTPException(404, f"{e}")
 
-@app.delete("/delete/avanue/{avanue_id}", response_model=schemas.Message)
-def delete_avanue(avanue_id: int, db: Session = Depends(get_db)):
+@app.delete("/delete/avanue/{avanue_id}", response_model=schemas.DeletionJob, status_code=202)
+async def delete_avanue(avanue_id: int, response: Response, db: AnySession = Depends(get_db)):
     try:
-        result = CRUDServices.AvanueService(db).delete_avanue(avanue_id)
-        return result
+        total = await run_in_session(db, lambda s: CRUDServices.AvanueService(s).prepare_delete_avanue(avanue_id))
     except Exception as e:
         raise HTTPException(404, f"{e}")
+    job = deletion_jobs.start("avanue", avanue_id, total)
+    response.headers["Location"] = f"/jobs/{job.id}"
+    return job
+
+@app.get("/jobs/{job_id}", response_model=schemas.DeletionJob)
+async def get_job(job_id: str):
+    job = deletion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, f"Job {job_id} is not known.")
+    return job
 
     
 @app.delete("/general_services/remove_customer_from_show/", response_model=schemas.Message)
-def delete_customer_from_show(customer_id: int, show_id: int, db: Session = Depends(get_db)):
+async def delete_customer_from_show(customer_id: int, show_id: int, db: AnySession = Depends(get_db)):
     try:
-        result = GeneralServices(db).remove_customer_from_show(customer_id, show_id)
+        result = await run_in_session(db, lambda s: GeneralServices(s).remove_customer_from_show(customer_id, show_id))
         return result
     except Exception as e:
         raise HTTPException(404, f"{e}")
     
 @app.delete("/general_services/remove_show_from_avanue", response_model=schemas.Message)
-def delete_Show_from_avanue(show_id: int, avanue_id: int, db: Session = Depends(get_db)):
+async def delete_Show_from_avanue(show_id: int, avanue_id: int, db: AnySession = Depends(get_db)):
     try:
-        result = GeneralServices(db).delete_show_from_avanue(show_id, avanue_id)
+        result = await run_in_session(db, lambda s: GeneralServices(s).delete_show_from_avanue(show_id, avanue_id))
         return result
     except Exception as e:
         raise HTTPException(404, f"{e}")
@@ -1,4 +1,4 @@
-from sqlalchemy import Integer, String, Boolean, ForeignKey, Table, Column
+from sqlalchemy import Integer, String, Boolean, Float, LargeBinary, ForeignKey, Table, Column, Index, event
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 class Base(DeclarativeBase):
@@ -19,17 +19,22 @@ class CustomerORM(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     name: Mapped[str] = mapped_column(String, nullable=False)
     age: Mapped[int] = mapped_column(Integer, nullable=False)
+    # bumped by every service mutation that changes the entity's detail response
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=1, server_default="1")
 
     show_list: Mapped[list["ShowORM"]] = relationship(secondary=customer_show,back_populates="customer_list")
 
 class ShowORM(Base):
     __tablename__ = "shows"
+    # the search endpoint filters on age_limit and head_count together and on title prefixes
+    __table_args__ = (Index("ix_shows_age_limit_head_count", "age_limit", "head_count"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    title: Mapped[str] = mapped_column(String, nullable=False)
+    title: Mapped[str] = mapped_column(String, nullable=False, index=True)
     age_limit: Mapped[int] = mapped_column(Integer, nullable=False)
     head_count: Mapped[int] = mapped_column(Integer, nullable=False)
     avanue_id: Mapped[int | None] = mapped_column(ForeignKey("avanues.id", ondelete="SET NULL"), index=True, nullable=True)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=1, server_default="1")
 
     customer_list: Mapped[list["CustomerORM"]] = relationship(secondary=customer_show,back_populates="show_list")
     avanue: Mapped["AvanueORM | None"] = relationship(back_populates="show_list")
@@ -41,6 +46,50 @@ class AvanueORM(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     name: Mapped[str] = mapped_column(String, nullable=False)
     availability:  Mapped[bool] = mapped_column(Boolean, nullable=False)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=1, server_default="1")
 
     show_list: Mapped[list["ShowORM"]] = relationship(back_populates="avanue", passive_deletes=True)
 
+
+# attendee and seat totals kept up to date by the services in the same transaction as the change,
+# so dashboards read one row instead of counting customer_show; `python -m occupancy` rebuilds them
+class ShowStatsORM(Base):
+    __tablename__ = "show_stats"
+
+    show_id: Mapped[int] = mapped_column(ForeignKey("shows.id", ondelete="CASCADE"), primary_key=True)
+    attendees: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class AvanueStatsORM(Base):
+    __tablename__ = "avanue_stats"
+
+    avanue_id: Mapped[int] = mapped_column(ForeignKey("avanues.id", ondelete="CASCADE"), primary_key=True)
+    shows: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    attendees: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    seats_remaining: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+# one row per entity table, bumped after every committed mutation of that table
+class TableVersionORM(Base):
+    __tablename__ = "table_versions"
+
+    name: Mapped[str] = mapped_column(String, primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=1)
+
+VERSIONED_TABLES = ("customers", "shows", "avanues")
+
+@event.listens_for(TableVersionORM.__table__, "after_create")
+def seed_table_versions(target, connection, **kw):
+    connection.execute(target.insert(), [{"name": name, "version": 1} for name in VERSIONED_TABLES])
+
+
+# responses of write requests sent with an Idempotency-Key, replayed when the request is retried
+class IdempotencyKeyORM(Base):
+    __tablename__ = "idempotency_keys"
+
+    key: Mapped[str] = mapped_column(String, primary_key=True)
+    fingerprint: Mapped[str] = mapped_column(String, nullable=False)
+    status: Mapped[int] = mapped_column(Integer, nullable=False)
+    headers: Mapped[str] = mapped_column(String, nullable=False)
+    body: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    created_at: Mapped[float] = mapped_column(Float, nullable=False, index=True)
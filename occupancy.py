@@ -0,0 +1,58 @@
+import argparse
+import asyncio
+import json
+import sys
+from sqlalchemy.orm import Session
+from database import init_db, run_in_new_session
+from repositories import StatsRepository
+
+MAX_REPORTED_DRIFT = 100
+
+
+def _drift(kind: str, stored: dict, expected: dict) -> list[dict]:
+    return [
+        {"kind": kind, "id": id, "stored": stored.get(id), "expected": expected.get(id)}
+        for id in sorted(stored.keys() | expected.keys())
+        if stored.get(id) != expected.get(id)
+    ]
+
+
+# recomputes show_stats and avanue_stats from customer_show, shows and avanues, reports every row
+# that differs from the stored one and, unless check_only, replaces the stored rows
+def rebuild(db: Session, check_only: bool = False) -> dict:
+    repo = StatsRepository(db)
+    expected_shows = repo.expected_show_stats()
+    expected_avanues = repo.expected_avanue_stats()
+    drift = _drift("show", repo.stored_show_stats(), expected_shows) + _drift("avanue", repo.stored_avanue_stats(), expected_avanues)
+
+    if not check_only:
+        repo.replace(expected_shows, expected_avanues)
+        db.commit()
+
+    return {
+        "shows": len(expected_shows),
+        "avanues": len(expected_avanues),
+        "drifted": len(drift),
+        "drift": drift[:MAX_REPORTED_DRIFT],
+        "rebuilt": not check_only,
+    }
+
+
+async def _run(check_only: bool) -> dict:
+    await init_db()
+    return await run_in_new_session(rebuild, check_only)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m occupancy", description="Rebuild the show and avanue statistics tables.")
+    parser.add_argument("--check", action="store_true", help="Only report drift; exit with status 1 if any row differs.")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(_run(args.check))
+    print(json.dumps(report, indent=2))
+
+    return 1 if args.check and report["drifted"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
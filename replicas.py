@@ -0,0 +1,53 @@
+import itertools
+import logging
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+
+logger = logging.getLogger("ticketing.replicas")
+
+
+# read-only engines served round-robin; a replica that fails with a connection or operational
+# error is ejected for eject_seconds and reads fall back to the others (or to the primary)
+class ReplicaSet:
+    def __init__(self, engines: list[Engine], session_factories: list, eject_seconds: float):
+        self.engines = engines
+        self.session_factories = session_factories
+        self.eject_seconds = eject_seconds
+        self._ejected_until = [0.0] * len(engines)
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+
+        for index, engine in enumerate(engines):
+            event.listen(engine, "handle_error", self._on_error(index))
+
+    def _on_error(self, index: int):
+        def handle_error(context):
+            if context.is_disconnect or isinstance(context.sqlalchemy_exception, OperationalError):
+                self.eject(index)
+        return handle_error
+
+    def eject(self, index: int):
+        with self._lock:
+            self._ejected_until[index] = time.monotonic() + self.eject_seconds
+        logger.warning("read replica %d ejected for %.0fs", index, self.eject_seconds)
+
+    def healthy(self) -> list[int]:
+        now = time.monotonic()
+        return [index for index, until in enumerate(self._ejected_until) if until <= now]
+
+    # session factory of the next healthy replica, None when there is none
+    def choose(self):
+        if not self.engines:
+            return None
+
+        with self._lock:
+            start = next(self._next)
+        now = time.monotonic()
+        for offset in range(len(self.engines)):
+            index = (start + offset) % len(self.engines)
+            if self._ejected_until[index] <= now:
+                return self.session_factories[index]
+        return None
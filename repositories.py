@@ -1,39 +1,638 @@
-from models import CustomerORM, ShowORM, AvanueORM
-from sqlalchemy.orm import Session
+import logging
+from models import CustomerORM, ShowORM, AvanueORM, TableVersionORM, IdempotencyKeyORM, ShowStatsORM, AvanueStatsORM, customer_show
+from sqlalchemy import select, update, insert, delete, func, exists, inspect, and_, or_, event
+from sqlalchemy.orm import Session, selectinload, joinedload, aliased
+from sqlalchemy.orm.attributes import set_committed_value
 from typing import Any
 
+logger = logging.getLogger("ticketing.versions")
+
 class GenericRepository:
+    # loader options matching the nested detail response schema of the entity
+    detail_options: tuple = ()
+    # the same for rows returned by INSERT/UPDATE ... RETURNING, which cannot be joined to
+    returning_options: tuple = ()
+    # columns of the read-list schema, selected as plain rows by the list fast path
+    list_columns: tuple = ()
+    table_name: str = ""
+
     def __init__(self, db: Session, model: Any):
         self.db = db
         self.model = model
 
     def get_all(self):
         return self.db.query(self.model).all()
+
+    def get_page(self, limit: int, after: int | None = None, options: tuple = ()):
+        query = self.db.query(self.model).options(*options).order_by(self.model.id)
+        if after is not None:
+            query = query.filter(self.model.id > after)
+
+        return query.limit(limit).all()
+
+    def _stream_statement(self, batch_size: int, after: int | None):
+        stmt = select(self.model).order_by(self.model.id).execution_options(yield_per=batch_size)
+        if after is not None:
+            stmt = stmt.where(self.model.id > after)
+
+        return stmt
+
+    def stream_all(self, batch_size: int = 500, after: int | None = None):
+        for batch in self.db.scalars(self._stream_statement(batch_size, after)).partitions():
+            yield batch
+            # rows already sent are of no further use, keep the identity map flat
+            for row in batch:
+                self.db.expunge(row)
+
+    async def stream_all_async(self, batch_size: int = 500, after: int | None = None):
+        result = await self.db.stream_scalars(self._stream_statement(batch_size, after))
+        async for batch in result.partitions():
+            yield batch
+            for row in batch:
+                self.db.expunge(row)
     
+    def _rows_statement(self, after: int | None):
+        stmt = select(*self.list_columns).order_by(self.model.id)
+        if after is not None:
+            stmt = stmt.where(self.model.id > after)
+
+        return stmt
+
+    def get_page_rows(self, limit: int, after: int | None = None):
+        return self.db.execute(self._rows_statement(after).limit(limit)).all()
+
+    def stream_rows(self, batch_size: int = 500, after: int | None = None):
+        for batch in self.db.execute(self._rows_statement(after).execution_options(yield_per=batch_size)).partitions():
+            yield batch
+
+    async def stream_rows_async(self, batch_size: int = 500, after: int | None = None):
+        result = await self.db.stream(self._rows_statement(after).execution_options(yield_per=batch_size))
+        async for batch in result.partitions():
+            yield batch
+
     def get(self, id: int):
         return self.db.query(self.model).filter(self.model.id == id).first()
+
+    # options replace the detail_options, e.g. to load a sparse fieldset
+    def get_detail(self, id: int, options: tuple | None = None):
+        options = self.detail_options if options is None else options
+        return self.db.query(self.model).options(*options).filter(self.model.id == id).first()
+    
+    # detail rows for many ids with one IN query and one eager-load pass, in the order of ids
+    def get_many(self, ids: list[int]):
+        rows = self.db.query(self.model).options(*self.detail_options).filter(self.model.id.in_(ids)).all()
+        by_id = {row.id: row for row in rows}
+
+        return [by_id[id] for id in ids if id in by_id]
     
     def add(self, model):
         self.db.add(model)
 
         return model
     
+    def add_returning(self, values: dict):
+        row = self.db.scalars(insert(self.model).values(**values).returning(self.model)).one()
+        # a new row has nothing related yet, mark its collections loaded so they are never lazy loaded
+        for relationship in inspect(self.model).relationships:
+            if relationship.uselist:
+                set_committed_value(row, relationship.key, [])
+
+        return row
+
+    def update_returning(self, id: int, values: dict):
+        stmt = (
+            update(self.model)
+            .where(self.model.id == id)
+            .values(**values, version=self.model.version + 1)
+            .returning(self.model)
+            .options(*self.returning_options)
+        )
+
+        return self.db.scalars(stmt).first()
+    
     def delete(self, model):
         self.db.delete(model)
 
         return None
 
+    # a bulk DELETE, nothing related is loaded; the caller clears the references first
+    def delete_by_id(self, id: int) -> bool:
+        stmt = delete(self.model).where(self.model.id == id).execution_options(synchronize_session=False)
+
+        return self.db.execute(stmt).rowcount == 1
+
+    def add_many(self, rows: list[dict]) -> list[int]:
+        return list(self.db.scalars(insert(self.model).values(rows).returning(self.model.id)))
+
+    def bump_versions(self, *criteria):
+        stmt = (
+            update(self.model)
+            .where(*criteria)
+            .values(version=self.model.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+        self.db.execute(stmt)
+
+        return None
+
+    # the version of the entity and the summed versions at the end of each relationship path
+    # (see fieldsets.relation_paths), so a change at any depth of a projection changes the key
+    def get_projection_version_key(self, id: int, paths: tuple):
+        sums = []
+        for path in paths:
+            root = current = aliased(self.model)
+            joins = []
+            for name, model in path:
+                related = aliased(model)
+                joins.append(getattr(current, name).of_type(related))
+                current = related
+
+            stmt = select(func.coalesce(func.sum(current.version), 0)).select_from(root)
+            for join in joins:
+                stmt = stmt.join(join)
+            sums.append(stmt.where(root.id == id).scalar_subquery())
+
+        return self._version_key(select(self.model.version, *sums).where(self.model.id == id))
+
+    def _version_key(self, stmt):
+        row = self.db.execute(stmt).first()
+
+        return tuple(row) if row is not None else None
+
 class CustomerRepository(GenericRepository):
+    table_name = CustomerORM.__tablename__
+    list_columns = (CustomerORM.id, CustomerORM.name, CustomerORM.age)
+    detail_options = (selectinload(CustomerORM.show_list).joinedload(ShowORM.avanue),)
+    returning_options = detail_options
+
     def __init__(self, db: Session):
         super().__init__(db, CustomerORM)
 
+    # locks the customer row until commit; an enrollment checks its customer_show foreign key
+    # against this row and waits for the lock, so no attendance can be added meanwhile
+    def lock(self, id: int) -> bool:
+        return self.db.scalar(select(CustomerORM.id).where(CustomerORM.id == id).with_for_update()) is not None
+
+    def get_ages(self, ids: list[int]) -> dict[int, int]:
+        rows = self.db.execute(select(CustomerORM.id, CustomerORM.age).where(CustomerORM.id.in_(ids)))
+
+        return {id: age for id, age in rows}
+
+    # versions of the customer and of everything its detail response embeds
+    def get_version_key(self, id: int):
+        stmt = (
+            select(CustomerORM.version, func.coalesce(func.sum(ShowORM.version), 0), func.coalesce(func.sum(AvanueORM.version), 0))
+            .select_from(CustomerORM)
+            .outerjoin(customer_show, customer_show.c.customer_id == CustomerORM.id)
+            .outerjoin(ShowORM, ShowORM.id == customer_show.c.show_id)
+            .outerjoin(AvanueORM, AvanueORM.id == ShowORM.avanue_id)
+            .where(CustomerORM.id == id)
+            .group_by(CustomerORM.id, CustomerORM.version)
+        )
+
+        return self._version_key(stmt)
+
 class ShowRepository(GenericRepository):
+    table_name = ShowORM.__tablename__
+    list_columns = (ShowORM.id, ShowORM.title, ShowORM.age_limit, ShowORM.head_count, ShowORM.avanue_id)
+    detail_options = (selectinload(ShowORM.customer_list), joinedload(ShowORM.avanue))
+    returning_options = (selectinload(ShowORM.customer_list), selectinload(ShowORM.avanue))
+
     def __init__(self, db: Session):
         super().__init__(db, ShowORM)
 
+    search_sorts = {"id": ShowORM.id, "title": ShowORM.title, "age_limit": ShowORM.age_limit, "head_count": ShowORM.head_count}
+
+    # one statement for any combination of filters; after is the (sort value, id) of the last row
+    # of the previous page and sort is a key of search_sorts, prefixed with "-" for descending
+    def search(
+        self,
+        limit: int,
+        after: tuple | None = None,
+        sort: str = "id",
+        title: str | None = None,
+        eligible_for_customer: int | None = None,
+        min_seats: int | None = None,
+        avanue_available: bool | None = None,
+    ):
+        stmt = select(*self.list_columns)
+        if title:
+            # the range lets the title index be used; it is only exact under byte-order collation,
+            # so the prefix is checked as well (LIKE is case sensitive on PostgreSQL, and on SQLite
+            # the range already is exact)
+            stmt = stmt.where(
+                ShowORM.title >= title,
+                ShowORM.title < title + "\U0010ffff",
+                ShowORM.title.startswith(title, autoescape=True),
+            )
+        if eligible_for_customer is not None:
+            age = select(CustomerORM.age).where(CustomerORM.id == eligible_for_customer).scalar_subquery()
+            attending = exists().where(customer_show.c.show_id == ShowORM.id, customer_show.c.customer_id == eligible_for_customer)
+            stmt = stmt.where(ShowORM.age_limit <= age, ~attending)
+        if min_seats is not None:
+            stmt = stmt.where(ShowORM.head_count >= min_seats)
+        if avanue_available is not None:
+            stmt = stmt.join(AvanueORM, AvanueORM.id == ShowORM.avanue_id).where(AvanueORM.availability.is_(avanue_available))
+
+        descending = sort.startswith("-")
+        column = self.search_sorts[sort.lstrip("-")]
+        if after is not None:
+            value, last_id = after
+            beyond = column < value if descending else column > value
+            stmt = stmt.where(or_(beyond, and_(column == value, ShowORM.id > last_id)))
+
+        stmt = stmt.order_by(column.desc() if descending else column, ShowORM.id).limit(limit)
+
+        return self.db.execute(stmt).all()
+
+    def get_version_key(self, id: int):
+        stmt = (
+            select(ShowORM.version, func.coalesce(func.sum(CustomerORM.version), 0), func.coalesce(AvanueORM.version, 0))
+            .select_from(ShowORM)
+            .outerjoin(customer_show, customer_show.c.show_id == ShowORM.id)
+            .outerjoin(CustomerORM, CustomerORM.id == customer_show.c.customer_id)
+            .outerjoin(AvanueORM, AvanueORM.id == ShowORM.avanue_id)
+            .where(ShowORM.id == id)
+            .group_by(ShowORM.id, ShowORM.version, AvanueORM.version)
+        )
+
+        return self._version_key(stmt)
+
+    # the new (head_count, version) of the show, None when not enough seats are left
+    def reserve_seats(self, show_id: int, seats: int = 1):
+        stmt = (
+            update(ShowORM)
+            .where(ShowORM.id == show_id, ShowORM.head_count >= seats)
+            .values(head_count=ShowORM.head_count - seats, version=ShowORM.version + 1)
+            .returning(ShowORM.head_count, ShowORM.version)
+            .execution_options(synchronize_session=False)
+        )
+
+        return self.db.execute(stmt).first()
+
+    def get_attendee_ids(self, show_id: int, customer_ids: list[int]) -> set[int]:
+        stmt = select(customer_show.c.customer_id).where(
+            customer_show.c.show_id == show_id, customer_show.c.customer_id.in_(customer_ids)
+        )
+
+        return set(self.db.scalars(stmt))
+
+    def _attendance_statement(self, batch_size: int):
+        return (
+            select(customer_show.c.customer_id, customer_show.c.show_id)
+            .order_by(customer_show.c.show_id, customer_show.c.customer_id)
+            .execution_options(yield_per=batch_size)
+        )
+
+    def stream_attendance(self, batch_size: int = 500):
+        for batch in self.db.execute(self._attendance_statement(batch_size)).partitions():
+            yield batch
+
+    async def stream_attendance_async(self, batch_size: int = 500):
+        result = await self.db.stream(self._attendance_statement(batch_size))
+        async for batch in result.partitions():
+            yield batch
+
+    def add_attendee(self, customer_id: int, show_id: int):
+        self.db.execute(insert(customer_show).values(customer_id=customer_id, show_id=show_id))
+
+        return None
+
+    def add_attendees(self, show_id: int, customer_ids: list[int]):
+        rows = [{"customer_id": customer_id, "show_id": show_id} for customer_id in customer_ids]
+        self.db.execute(insert(customer_show).values(rows))
+
+        return None
+
+    def remove_attendee(self, customer_id: int, show_id: int) -> bool:
+        stmt = delete(customer_show).where(customer_show.c.customer_id == customer_id, customer_show.c.show_id == show_id)
+
+        return self.db.execute(stmt).rowcount == 1
+
+    def release_seats(self, show_id: int, seats: int = 1):
+        stmt = (
+            update(ShowORM)
+            .where(ShowORM.id == show_id)
+            .values(head_count=ShowORM.head_count + seats, version=ShowORM.version + 1)
+            .returning(ShowORM.head_count, ShowORM.version)
+            .execution_options(synchronize_session=False)
+        )
+
+        return self.db.execute(stmt).first()
+
+    def get_seats(self, ids: list[int]):
+        return self.db.execute(select(ShowORM.id, ShowORM.head_count, ShowORM.version).where(ShowORM.id.in_(ids))).all()
+
+    # only an unassigned show moves into an avanue, and only while the avanue is available
+    def assign_avanue(self, show_id: int, avanue_id: int) -> bool:
+        available = exists().where(AvanueORM.id == avanue_id, AvanueORM.availability.is_(True))
+        stmt = (
+            update(ShowORM)
+            .where(ShowORM.id == show_id, ShowORM.avanue_id.is_(None), available)
+            .values(avanue_id=avanue_id, version=ShowORM.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+
+        return self.db.execute(stmt).rowcount == 1
+
+    def unassign_avanue(self, show_id: int, avanue_id: int) -> bool:
+        stmt = (
+            update(ShowORM)
+            .where(ShowORM.id == show_id, ShowORM.avanue_id == avanue_id)
+            .values(avanue_id=None, version=ShowORM.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+
+        return self.db.execute(stmt).rowcount == 1
+
+    def count_attendance(self, customer_id: int) -> int:
+        return self.db.scalar(select(func.count()).select_from(customer_show).where(customer_show.c.customer_id == customer_id))
+
+    # deletes up to limit customer_show rows of the customer; returns the show ids they pointed to
+    def remove_attendance(self, customer_id: int, limit: int) -> list[int]:
+        chunk = select(customer_show.c.show_id).where(customer_show.c.customer_id == customer_id).limit(limit)
+        stmt = (
+            delete(customer_show)
+            .where(customer_show.c.customer_id == customer_id, customer_show.c.show_id.in_(chunk))
+            .returning(customer_show.c.show_id)
+        )
+
+        return list(self.db.scalars(stmt))
+
+    # gives one seat back to each show; returns their (id, head_count, version)
+    def release_seat_each(self, show_ids: list[int]):
+        stmt = (
+            update(ShowORM)
+            .where(ShowORM.id.in_(show_ids))
+            .values(head_count=ShowORM.head_count + 1, version=ShowORM.version + 1)
+            .returning(ShowORM.id, ShowORM.head_count, ShowORM.version)
+            .execution_options(synchronize_session=False)
+        )
+
+        return self.db.execute(stmt).all()
+
+    def count_in_avanue(self, avanue_id: int) -> int:
+        return self.db.scalar(select(func.count()).select_from(ShowORM).where(ShowORM.avanue_id == avanue_id))
+
+    # moves up to limit shows out of the avanue; returns their ids
+    def unassign_all(self, avanue_id: int, limit: int) -> list[int]:
+        chunk = select(ShowORM.id).where(ShowORM.avanue_id == avanue_id).limit(limit)
+        stmt = (
+            update(ShowORM)
+            .where(ShowORM.id.in_(chunk))
+            .values(avanue_id=None, version=ShowORM.version + 1)
+            .returning(ShowORM.id)
+            .execution_options(synchronize_session=False)
+        )
+
+        return list(self.db.scalars(stmt))
+
 class AvanueRepository(GenericRepository):
+    table_name = AvanueORM.__tablename__
+    list_columns = (AvanueORM.id, AvanueORM.name, AvanueORM.availability)
+    detail_options = (selectinload(AvanueORM.show_list),)
+    returning_options = detail_options
+
     def __init__(self, db: Session):
         super().__init__(db, AvanueORM)
 
+    # unlike update_returning, does not load the avanue's shows
+    def close(self, id: int) -> bool:
+        stmt = (
+            update(AvanueORM)
+            .where(AvanueORM.id == id)
+            .values(availability=False, version=AvanueORM.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+
+        return self.db.execute(stmt).rowcount == 1
+
+    def get_version_key(self, id: int):
+        stmt = (
+            select(AvanueORM.version, func.coalesce(func.sum(ShowORM.version), 0))
+            .select_from(AvanueORM)
+            .outerjoin(ShowORM, ShowORM.avanue_id == AvanueORM.id)
+            .where(AvanueORM.id == id)
+            .group_by(AvanueORM.id, AvanueORM.version)
+        )
+
+        return self._version_key(stmt)
+
+class TableVersionRepository:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def get(self, name: str) -> int:
+        return self.db.scalar(select(TableVersionORM.version).where(TableVersionORM.name == name)) or 0
+
+    # the versions of names in sorted order of the names
+    def get_many(self, names) -> list[int]:
+        stmt = select(TableVersionORM.name, TableVersionORM.version).where(TableVersionORM.name.in_(names))
+        versions = dict(self.db.execute(stmt).all())
+
+        return [versions.get(name, 0) for name in sorted(names)]
+
+    # the counters are shared by every write to a table, so they are bumped in a short transaction
+    # of their own once the write committed (see _bump_committed) instead of staying locked for the
+    # whole write; until then a list still answers with the previous version
+    def bump(self, *names: str):
+        self.db.info.setdefault("bump_tables", set()).update(names)
+
+        return None
+
+@event.listens_for(Session, "after_commit")
+def _bump_committed(session: Session):
+    names = session.info.pop("bump_tables", None)
+    if not names:
+        return None
+
+    stmt = (
+        update(TableVersionORM)
+        .where(TableVersionORM.name.in_(names))
+        .values(version=TableVersionORM.version + 1)
+    )
+    try:
+        with session.get_bind().begin() as connection:
+            connection.execute(stmt)
+    except Exception:
+        # the write itself is committed; the lists catch up with the next bump of the table
+        logger.exception("Bumping the versions of %s failed", ", ".join(sorted(names)))
+
+@event.listens_for(Session, "after_rollback")
+def _drop_bumps(session: Session):
+    session.info.pop("bump_tables", None)
+
+class StatsRepository:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def add_shows(self, ids: list[int]):
+        if ids:
+            self.db.execute(insert(ShowStatsORM).values([{"show_id": id, "attendees": 0} for id in ids]))
+
+        return None
+
+    def add_avanues(self, ids: list[int]):
+        if ids:
+            self.db.execute(insert(AvanueStatsORM).values([{"avanue_id": id, "shows": 0, "attendees": 0, "seats_remaining": 0} for id in ids]))
+
+        return None
+
+    def _update_avanue_of(self, show_id: int, **values):
+        avanue_id = select(ShowORM.avanue_id).where(ShowORM.id == show_id).scalar_subquery()
+        self.db.execute(update(AvanueStatsORM).where(AvanueStatsORM.avanue_id == avanue_id).values(**values))
+
+    # attendees joined (positive) or left (negative) the show and its head_count moved by seats
+    def count_attendees(self, show_id: int, attendees: int, seats: int):
+        self.db.execute(
+            update(ShowStatsORM).where(ShowStatsORM.show_id == show_id).values(attendees=ShowStatsORM.attendees + attendees)
+        )
+        self._update_avanue_of(
+            show_id,
+            attendees=AvanueStatsORM.attendees + attendees,
+            seats_remaining=AvanueStatsORM.seats_remaining + seats,
+        )
+
+        return None
+
+    # runs before the show's head_count is changed to head_count
+    def resize_show(self, show_id: int, head_count: int):
+        current = select(ShowORM.head_count).where(ShowORM.id == show_id).scalar_subquery()
+        self._update_avanue_of(show_id, seats_remaining=AvanueStatsORM.seats_remaining + head_count - current)
+
+        return None
 
+    # sign is 1 when the show joins the avanue and -1 when it leaves
+    def move_show(self, show_id: int, avanue_id: int, sign: int):
+        attendees = select(ShowStatsORM.attendees).where(ShowStatsORM.show_id == show_id).scalar_subquery()
+        head_count = select(ShowORM.head_count).where(ShowORM.id == show_id).scalar_subquery()
+        stmt = (
+            update(AvanueStatsORM)
+            .where(AvanueStatsORM.avanue_id == avanue_id)
+            .values(
+                shows=AvanueStatsORM.shows + sign,
+                attendees=AvanueStatsORM.attendees + sign * func.coalesce(attendees, 0),
+                seats_remaining=AvanueStatsORM.seats_remaining + sign * head_count,
+            )
+        )
+        self.db.execute(stmt)
+
+        return None
+
+    # runs before the show is deleted
+    def drop_show(self, show_id: int):
+        avanue_id = select(ShowORM.avanue_id).where(ShowORM.id == show_id).scalar_subquery()
+        self.move_show(show_id, avanue_id, -1)
+        self.db.execute(delete(ShowStatsORM).where(ShowStatsORM.show_id == show_id))
+
+        return None
+
+    def drop_avanue(self, avanue_id: int):
+        self.db.execute(delete(AvanueStatsORM).where(AvanueStatsORM.avanue_id == avanue_id))
+
+        return None
+
+    # each of the shows lost one attendee and got its seat back
+    def release_attendees(self, show_ids: list[int]):
+        self.db.execute(update(ShowStatsORM).where(ShowStatsORM.show_id.in_(show_ids)).values(attendees=ShowStatsORM.attendees - 1))
+
+        released = (
+            select(func.count())
+            .select_from(ShowORM)
+            .where(ShowORM.id.in_(show_ids), ShowORM.avanue_id == AvanueStatsORM.avanue_id)
+            .scalar_subquery()
+        )
+        avanues = select(ShowORM.avanue_id).where(ShowORM.id.in_(show_ids))
+        stmt = (
+            update(AvanueStatsORM)
+            .where(AvanueStatsORM.avanue_id.in_(avanues))
+            .values(attendees=AvanueStatsORM.attendees - released, seats_remaining=AvanueStatsORM.seats_remaining + released)
+        )
+        self.db.execute(stmt)
+
+        return None
+
+    def get_show(self, show_id: int):
+        stmt = (
+            select(ShowORM.id, ShowStatsORM.attendees, ShowORM.head_count)
+            .join(ShowStatsORM, ShowStatsORM.show_id == ShowORM.id)
+            .where(ShowORM.id == show_id)
+        )
+
+        return self.db.execute(stmt).first()
+
+    def get_avanue(self, avanue_id: int):
+        return self.db.get(AvanueStatsORM, avanue_id)
+
+    # the totals as they follow from shows and customer_show, for the rebuild
+    def expected_show_stats(self) -> dict[int, int]:
+        stmt = (
+            select(ShowORM.id, func.count(customer_show.c.customer_id))
+            .outerjoin(customer_show, customer_show.c.show_id == ShowORM.id)
+            .group_by(ShowORM.id)
+        )
+
+        return dict(self.db.execute(stmt).all())
+
+    def expected_avanue_stats(self) -> dict[int, tuple[int, int, int]]:
+        attendance = (
+            select(customer_show.c.show_id, func.count().label("attendees"))
+            .group_by(customer_show.c.show_id)
+            .subquery()
+        )
+        stmt = (
+            select(
+                AvanueORM.id,
+                func.count(ShowORM.id),
+                func.coalesce(func.sum(attendance.c.attendees), 0),
+                func.coalesce(func.sum(ShowORM.head_count), 0),
+            )
+            .outerjoin(ShowORM, ShowORM.avanue_id == AvanueORM.id)
+            .outerjoin(attendance, attendance.c.show_id == ShowORM.id)
+            .group_by(AvanueORM.id)
+        )
+
+        return {id: (shows, attendees, seats) for id, shows, attendees, seats in self.db.execute(stmt)}
+
+    def stored_show_stats(self) -> dict[int, int]:
+        return dict(self.db.execute(select(ShowStatsORM.show_id, ShowStatsORM.attendees)).all())
+
+    def stored_avanue_stats(self) -> dict[int, tuple[int, int, int]]:
+        stmt = select(AvanueStatsORM.avanue_id, AvanueStatsORM.shows, AvanueStatsORM.attendees, AvanueStatsORM.seats_remaining)
+
+        return {id: (shows, attendees, seats) for id, shows, attendees, seats in self.db.execute(stmt)}
+
+    def replace(self, shows: dict[int, int], avanues: dict[int, tuple[int, int, int]]):
+        self.db.execute(delete(ShowStatsORM))
+        self.db.execute(delete(AvanueStatsORM))
+        # executemany, a single multi-row VALUES could exceed the driver's parameter limit
+        if shows:
+            self.db.execute(insert(ShowStatsORM), [{"show_id": id, "attendees": n} for id, n in shows.items()])
+        if avanues:
+            self.db.execute(insert(AvanueStatsORM), [
+                {"avanue_id": id, "shows": n, "attendees": attendees, "seats_remaining": seats}
+                for id, (n, attendees, seats) in avanues.items()
+            ])
+
+        return None
+
+class IdempotencyKeyRepository:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def get(self, key: str, newer_than: float):
+        return self.db.scalars(
+            select(IdempotencyKeyORM).where(IdempotencyKeyORM.key == key, IdempotencyKeyORM.created_at > newer_than)
+        ).first()
+
+    # a key that expired but was not purged yet is overwritten
+    def save(self, values: dict):
+        self.db.merge(IdempotencyKeyORM(**values))
+
+        return None
+
+    def purge(self, older_than: float):
+        self.db.execute(delete(IdempotencyKeyORM).where(IdempotencyKeyORM.created_at <= older_than))
+
+        return None
 
@@ -34,6 +34,14 @@ class AvanueUpdate(Base):
     name: str | None = Field(default=None, description="Name of the avanue.")
     availability: bool | None = Field(default=None, description="Availability of the avanue. True/False")
 
+class EnrollmentAdd(Base):
+    customer_id: int = Field(description="Customer to admit.")
+    show_id: int = Field(description="Show the customer is admitted to.")
+
+class BulkEnrollmentAdd(Base):
+    show_id: int = Field(description="Show the customers are admitted to.")
+    customer_ids: list[int] = Field(min_length=1, max_length=5000, description="Customers to admit, in priority order.")
+
 
 # ----- RESPONSE SCHEMAS -----
 class CustomerReadList(Base):
@@ -57,7 +65,11 @@ class Customer(Base):
     id: int
     name: str = Field(description="Name of customer.")
     age: int = Field(description="Age of customer.")
-    show_list: list["Show"] = Field(default_factory=list, description="List of the shows customer attends to.")
+    show_list: list["CustomerShow"] = Field(default_factory=list, description="List of the shows customer attends to.")
+
+# nested views are kept one level deep so a detail response never walks the relationship graph
+class CustomerShow(ShowReadList):
+    avanue: AvanueReadList | None = Field(default=None, description="Avanue of the show.")
 
 class Show(Base):
     id: int = Field(description="A unique identifier of the show.")
@@ -65,14 +77,84 @@ class Show(Base):
     age_limit: int = Field(description="Age limit of the show.")
     head_count: int = Field(description="Places available on the show.")
     avanue_id: int | None = Field(default=None, description="Avanue id associated with the show.")
-    customer_list: list["Customer"] = Field(default_factory=list, description="Customers enrolled at the show.")
-    avanue: Avanue | None = Field(default=None, description="Avanue of the show.")
+    customer_list: list[CustomerReadList] = Field(default_factory=list, description="Customers enrolled at the show.")
+    avanue: AvanueReadList | None = Field(default=None, description="Avanue of the show.")
 
 class Avanue(Base):
     id: int = Field(description="A unique identifier of the avanue.")
     name: str = Field(description="Name of the avanue.")
     availability: bool = Field(default=True, description="Availability of the avanue.")
-    show_list: list["Show"] = Field(default_factory=list , description="Shows listed for the avanue.")
+    show_list: list[ShowReadList] = Field(default_factory=list , description="Shows listed for the avanue.")
+
+class EnrollmentResult(Base):
+    customer_id: int
+    admitted: bool = Field(description="Whether the customer got a seat.")
+    message: str
+
+class BulkEnrollmentResult(Base):
+    show_id: int
+    admitted: int = Field(description="Number of customers admitted.")
+    results: list[EnrollmentResult] = Field(default_factory=list, description="Outcome per requested customer.")
+
+class CacheStats(Base):
+    hits: int
+    misses: int
+    evictions: int
+    entries: int = Field(description="Entries currently held by the cache.")
+
+class DeletionJob(Base):
+    id: str
+    kind: str = Field(description="customer or avanue.")
+    target_id: int
+    status: str = Field(description="running, done or failed.")
+    total: int = Field(description="Enrollments (customer) or shows (avanue) to detach, counted when the job started.")
+    processed: int = Field(description="Enrollments or shows detached so far.")
+    error: str | None = None
+    created_at: float
+    finished_at: float | None = None
+
+class AdmissionStats(Base):
+    limit: int = Field(description="Requests of the class allowed to run at once.")
+    active: int
+    queue_depth: int = Field(description="Requests waiting for a slot.")
+    queue_size: int
+    admitted: int
+    queued: int = Field(description="Admitted or shed requests that had to wait.")
+    shed_queue_full: int = Field(description="Requests answered 503 because the queue was full.")
+    shed_timeout: int = Field(description="Requests answered 503 after waiting for the queue timeout.")
+
+class ShowStats(Base):
+    show_id: int
+    sold: int = Field(description="Customers admitted to the show.")
+    remaining: int = Field(description="Seats left.")
+
+class AvanueStats(Base):
+    avanue_id: int
+    shows: int = Field(description="Shows assigned to the avanue.")
+    sold: int = Field(description="Customers admitted to the avanue's shows.")
+    remaining: int = Field(description="Seats left across the avanue's shows.")
+
+class ImportRowError(Base):
+    row: int = Field(description="1-based data row of the import (the CSV header is not counted).")
+    error: str
+
+class ImportReport(Base):
+    received: int = Field(default=0, description="Data rows read from the upload.")
+    inserted: int = Field(default=0, description="Rows stored.")
+    failed: int = Field(default=0, description="Rows rejected.")
+    errors: list[ImportRowError] = Field(default_factory=list, description="Rejected rows, capped at the first 1000.")
+
+class CustomerBatch(Base):
+    items: list[Customer] = Field(default_factory=list, description="Found customers, in the order requested.")
+    missing: list[int] = Field(default_factory=list, description="Requested ids that are not in the repository.")
+
+class ShowBatch(Base):
+    items: list[Show] = Field(default_factory=list, description="Found shows, in the order requested.")
+    missing: list[int] = Field(default_factory=list, description="Requested ids that are not in the repository.")
+
+class AvanueBatch(Base):
+    items: list[Avanue] = Field(default_factory=list, description="Found avanues, in the order requested.")
+    missing: list[int] = Field(default_factory=list, description="Requested ids that are not in the repository.")
 
 # for circular referance
 Customer.model_rebuild()
@@ -0,0 +1,39 @@
+import threading
+import time
+import settings
+
+
+class ShowSoldOut(ValueError):
+    pass
+
+
+# in-process copy of the seats left per show, so enrollments for a sold-out show are turned away
+# without touching the database; the database stays authoritative for every admission, entries go
+# stale after SEAT_GATE_RESYNC_SECONDS (other processes may have freed seats) and are then re-read
+class SeatGate:
+    def __init__(self, resync_seconds: float):
+        self.resync_seconds = resync_seconds
+        self._seats: dict[int, tuple[int, float]] = {}
+        self._lock = threading.Lock()
+
+    # True only while the last count the database confirmed is 0; in-flight enrollments are not
+    # counted, since the database may still refuse them and the seat would look taken meanwhile
+    def sold_out(self, show_id: int) -> bool:
+        with self._lock:
+            entry = self._seats.get(show_id)
+            return entry is not None and entry[1] > time.monotonic() and entry[0] <= 0
+
+    def sync(self, show_id: int, seats: int):
+        if self.resync_seconds <= 0:
+            return None
+
+        with self._lock:
+            self._seats[show_id] = (seats, time.monotonic() + self.resync_seconds)
+
+    def forget(self, *show_ids: int):
+        with self._lock:
+            for show_id in show_ids:
+                self._seats.pop(show_id, None)
+
+
+seat_gate = SeatGate(settings.SEAT_GATE_RESYNC_SECONDS)
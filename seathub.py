@@ -0,0 +1,84 @@
+import asyncio
+import threading
+from collections import defaultdict
+import settings
+
+
+class SeatSubscription:
+    def __init__(self, show_ids: list[int]):
+        self.show_ids = show_ids
+        self._versions: dict[int, int] = {}
+        self._changes: dict[int, int] = {}
+        self._ready = asyncio.Event()
+
+    # versions keep a publish that arrives late from going back behind what the client has seen
+    def push(self, show_id: int, head_count: int, version: int):
+        if version <= self._versions.get(show_id, 0):
+            return None
+
+        self._versions[show_id] = version
+        self._changes[show_id] = head_count
+        self._ready.set()
+
+    # the latest head_count of every show that changed since the last call, empty after timeout seconds
+    async def changes(self, timeout: float) -> dict[int, int]:
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return {}
+
+        self._ready.clear()
+        changes, self._changes = self._changes, {}
+        return changes
+
+
+# in-process pub/sub of seat counts: services publish after commit from any thread, and one
+# asyncio task hands the latest count per show to the subscribers once per interval, so a burst
+# of enrollments becomes a single event per show
+class SeatHub:
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pending: dict[int, tuple[int, int]] = {}
+        self._subscribers: defaultdict[int, set[SeatSubscription]] = defaultdict(set)
+        self._task: asyncio.Task | None = None
+
+    def publish(self, show_id: int, head_count: int, version: int):
+        if show_id not in self._subscribers:
+            return None
+
+        with self._lock:
+            pending = self._pending.get(show_id)
+            if pending is None or pending[1] < version:
+                self._pending[show_id] = (head_count, version)
+
+    def subscribe(self, show_ids: list[int]) -> SeatSubscription:
+        subscription = SeatSubscription(show_ids)
+        for show_id in show_ids:
+            self._subscribers[show_id].add(subscription)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._flush())
+
+        return subscription
+
+    def unsubscribe(self, subscription: SeatSubscription):
+        for show_id in subscription.show_ids:
+            subscribers = self._subscribers.get(show_id)
+            if subscribers is None:
+                continue
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[show_id]
+
+    async def _flush(self):
+        while self._subscribers:
+            await asyncio.sleep(self.interval)
+            with self._lock:
+                pending, self._pending = self._pending, {}
+
+            for show_id, (head_count, version) in pending.items():
+                for subscription in self._subscribers.get(show_id, ()):
+                    subscription.push(show_id, head_count, version)
+
+
+seat_hub = SeatHub(settings.SEAT_EVENTS_INTERVAL_SECONDS)
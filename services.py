@@ -1,60 +1,116 @@
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from repositories import CustomerRepository, ShowRepository, AvanueRepository
-from models import CustomerORM, ShowORM, AvanueORM
+from repositories import CustomerRepository, ShowRepository, AvanueRepository, TableVersionRepository, StatsRepository
+from models import CustomerORM, AvanueORM, customer_show
+from cache import entity_cache
+from seatgate import seat_gate, ShowSoldOut
+from seathub import seat_hub
 import schemas
 
+# runs the single-row business checks and inserts the rows that pass with one multi-row statement;
+# returns the (position, message) of every rejected payload. created gets the new ids before the commit
+def _enroll_many(service, check, payloads: list, table: str, created=None):
+    errors = []
+    rows = []
+    for position, payload in enumerate(payloads):
+        try:
+            check(payload)
+        except ValueError as e:
+            errors.append((position, f"{e}"))
+            continue
+        rows.append(payload.model_dump())
+
+    if rows:
+        ids = service.repo.add_many(rows)
+        if created is not None:
+            created(ids)
+        service.versions.bump(table)
+        service.db.commit()
+
+    return len(rows), errors
+
 class CRUDServices:
     class CustomerService:
         def __init__(self, db: Session):
             self.db = db
             self.repo = CustomerRepository(db)
+            self.versions = TableVersionRepository(db)
 
-        def enroll_customer(self, payload: schemas.CustomerAdd):
+        def check_customer(self, payload: schemas.CustomerAdd):
             if not payload.age or not payload.name: 
                 raise ValueError("Please provide name and age for the customer.")
             
             if not (5 <= payload.age <= 120):
                 raise ValueError("The age for customer must be between 5 and 120 maximum.")
-            
-            customer = CustomerORM(
-                name = payload.name,
-                age = payload.age
-            )
 
-            self.repo.add(customer)
+        def enroll_customer(self, payload: schemas.CustomerAdd):
+            self.check_customer(payload)
+            
+            customer = self.repo.add_returning(payload.model_dump())
+            self.versions.bump("customers")
             self.db.commit()
-            self.db.refresh(customer)
 
             return customer
 
+        def enroll_customers(self, payloads: list[schemas.CustomerAdd]):
+            return _enroll_many(self, self.check_customer, payloads, "customers")
 
-        def delete_customer(self, id: int):
-            customer = self.repo.get(id)
-            if not customer:
+
+        # deleting runs as a background job in chunks (see deletion.py); this checks the customer
+        # exists and returns how many enrollments the job has to remove
+        def prepare_delete_customer(self, id: int) -> int:
+            if not self.repo.get(id):
                 raise ValueError("Customer is not in the repository.")
-            
-            self.repo.delete(customer)
+
+            return ShowRepository(self.db).count_attendance(id)
+
+        # removes up to size enrollments of the customer and gives their seats back, all in one
+        # transaction; the chunk that finds fewer deletes the customer as well. Returns
+        # (enrollments removed, finished)
+        def delete_customer_chunk(self, id: int, size: int):
+            # enrollments committing while a chunk runs would otherwise be missed by the final
+            # chunk and break the foreign key of the customer delete
+            if not self.repo.lock(id):
+                return 0, True
+
+            shows = ShowRepository(self.db)
+            show_ids = shows.remove_attendance(id, size)
+            seats = shows.release_seat_each(show_ids) if show_ids else []
+            if show_ids:
+                StatsRepository(self.db).release_attendees(show_ids)
+            finished = len(show_ids) < size
+            if finished:
+                self.repo.delete_by_id(id)
+                self.versions.bump("customers")
+            else:
+                self.repo.bump_versions(CustomerORM.id == id)
+            self.versions.bump("shows")
             self.db.commit()
 
-            return {"message": "Customer has been removed succesfully."}
+            entity_cache.invalidate(("customer", id), *[("show", show_id) for show_id in show_ids])
+            for show_id, head_count, version in seats:
+                seat_gate.sync(show_id, head_count)
+                seat_hub.publish(show_id, head_count, version)
+
+            return len(show_ids), finished
 
         
         def update_customer(self, id: int, payload: schemas.CustomerUpdate):
-            current_customer = self.repo.get(id)
-            if not current_customer:
-                raise ValueError("Customer is not in the repository.")
-            
             changes = payload.model_dump(exclude_none=True)
 
-            if "name" in changes:
-                current_customer.name = changes["name"]
             if "age" in changes:
                 if not  (5 <= changes["age"] <= 120):
                     raise ValueError("The new age must be between 5 and 120.")
-                current_customer.age = changes["age"]
-            
+
+            # the UPDATE returns the new row state, nothing is read back after the commit
+            current_customer = self.repo.update_returning(id, changes)
+            if not current_customer:
+                raise ValueError("Customer is not in the repository.")
+
+            self.versions.bump("customers")
             self.db.commit()
-            self.db.refresh(current_customer)
+            entity_cache.invalidate(("customer", id))
 
             return current_customer
 
@@ -63,53 +119,66 @@ class CRUDServices:
         def __init__(self, db: Session):
             self.db = db
             self.repo = ShowRepository(db)
+            self.versions = TableVersionRepository(db)
+            self.stats = StatsRepository(db)
 
-        def enroll_show(self, payload: schemas.ShowAdd):
+        def check_show(self, payload: schemas.ShowAdd):
             if not payload.title or not payload.age_limit or not payload.head_count:
                 raise ValueError("Please pass in the necassery information.")
-            
-            show = ShowORM(
-                title = payload.title,
-                age_limit = payload.age_limit,
-                head_count = payload.head_count
-            )
 
-            self.repo.add(show)
+        def enroll_show(self, payload: schemas.ShowAdd):
+            self.check_show(payload)
+            
+            show = self.repo.add_returning(payload.model_dump())
+            self.stats.add_shows([show.id])
+            self.versions.bump("shows")
             self.db.commit()
-            self.db.refresh(show)
 
             return show
 
+        def enroll_shows(self, payloads: list[schemas.ShowAdd]):
+            return _enroll_many(self, self.check_show, payloads, "shows", self.stats.add_shows)
+
         def delete_show(self, id: int):
             show = self.repo.get(id)
             if not show:
                 raise ValueError("Show is not in the repository.")
 
+            CustomerRepository(self.db).bump_versions(CustomerORM.id.in_(select(customer_show.c.customer_id).where(customer_show.c.show_id == id)))
+            if show.avanue_id is not None:
+                AvanueRepository(self.db).bump_versions(AvanueORM.id == show.avanue_id)
+            self.stats.drop_show(id)
             self.repo.delete(show)   
+            self.versions.bump("shows", "avanues")
             self.db.commit()
+            entity_cache.invalidate(("show", id))
+            seat_gate.forget(id)
 
             return {"message": "The show has been deleted."}
 
         def update_show(self, id: int, payload: schemas.ShowUpdate):
-            show = self.repo.get(id)
-            if not show:
-                raise ValueError("The show is not in the repository.")
-
             changes = payload.model_dump(exclude_none=True) 
             max_headcount = 50000
             max_age_limit = 25
 
-            if "title" in changes:
-                show.title = changes["title"]
             if "age_limit" in changes:
-                if not changes["age_limit"] > max_age_limit:
-                    show.age_limit = changes["age_limit"]
+                if changes["age_limit"] > max_age_limit:
+                    del changes["age_limit"]
             if "head_count" in changes:
-                if not changes["head_count"] > max_headcount:
-                    show.head_count = changes["head_count"]
-            
+                if changes["head_count"] > max_headcount:
+                    del changes["head_count"]
+
+            if "head_count" in changes:
+                self.stats.resize_show(id, changes["head_count"])
+            show = self.repo.update_returning(id, changes)
+            if not show:
+                raise ValueError("The show is not in the repository.")
+
+            self.versions.bump("shows")
             self.db.commit()
-            self.db.refresh(show)
+            entity_cache.invalidate(("show", id))
+            seat_gate.sync(id, show.head_count)
+            seat_hub.publish(id, show.head_count, show.version)
 
             return show
         
@@ -118,46 +187,64 @@ class CRUDServices:
         def __init__(self, db: Session):
             self.db = db
             self.repo = AvanueRepository(db)
+            self.versions = TableVersionRepository(db)
+            self.stats = StatsRepository(db)
 
-        def enroll_avanue(self, payload: schemas.AvanueAdd):
+        def check_avanue(self, payload: schemas.AvanueAdd):
             if payload.name is None or payload.availability is None:
                 raise ValueError("Please provide the required details.")
-            
-            avanue = AvanueORM(
-                name = payload.name,
-                availability = payload.availability
-            )
 
-            self.repo.add(avanue)
+        def enroll_avanue(self, payload: schemas.AvanueAdd):
+            self.check_avanue(payload)
+            
+            avanue = self.repo.add_returning(payload.model_dump())
+            self.stats.add_avanues([avanue.id])
+            self.versions.bump("avanues")
             self.db.commit()
-            self.db.refresh(avanue)
 
             return avanue
+
+        def enroll_avanues(self, payloads: list[schemas.AvanueAdd]):
+            return _enroll_many(self, self.check_avanue, payloads, "avanues", self.stats.add_avanues)
         
-        def delete_avanue(self, id: int):
-            avanue = self.repo.get(id)
-            if not avanue:
+        # closes the avanue, so no show is assigned to it while the deletion job runs, and returns
+        # how many shows the job has to move out
+        def prepare_delete_avanue(self, id: int) -> int:
+            if not self.repo.close(id):
                 raise ValueError("The avanue is not in the repository.")
-            
-            self.repo.delete(avanue)
+
+            self.versions.bump("avanues")
             self.db.commit()
+            entity_cache.invalidate(("avanue", id))
+
+            return ShowRepository(self.db).count_in_avanue(id)
+
+        # moves up to size shows out of the avanue in one transaction; the chunk that finds fewer
+        # deletes the avanue as well. Returns (shows moved, finished)
+        def delete_avanue_chunk(self, id: int, size: int):
+            show_ids = ShowRepository(self.db).unassign_all(id, size)
+            finished = len(show_ids) < size
+            if finished:
+                self.stats.drop_avanue(id)
+                self.repo.delete_by_id(id)
+            else:
+                self.repo.bump_versions(AvanueORM.id == id)
+            self.versions.bump("avanues", "shows")
+            self.db.commit()
+            entity_cache.invalidate(("avanue", id), *[("show", show_id) for show_id in show_ids])
 
-            return {"message": "The avanue has been deleted succesfully."}
+            return len(show_ids), finished
         
         def update_avanue(self, id: int, payload: schemas.AvanueUpdate):
-            avanue = self.repo.get(id)
+            changes = payload.model_dump(exclude_none=True)
+
+            avanue = self.repo.update_returning(id, changes)
             if not avanue:
                 raise ValueError("The avanue is not in the repository.")
-            
-            changes = payload.model_dump(exclude_none=True)
 
-            if "name" in changes:
-                avanue.name = changes["name"]
-            if "availability" in changes:
-                avanue.availability = changes["availability"]
-            
+            self.versions.bump("avanues")
             self.db.commit()
-            self.db.refresh(avanue)
+            entity_cache.invalidate(("avanue", id))
 
             return avanue
 
@@ -168,8 +255,26 @@ class GeneralServices:
         self.repo_customer = CustomerRepository(db)
         self.repo_show = ShowRepository(db)
         self.repo_avanue = AvanueRepository(db)
+        self.versions = TableVersionRepository(db)
+        self.stats = StatsRepository(db)
     
     def enroll_customer_to_show(self, customer_id: int, show_id: int):
+        if seat_gate.sold_out(show_id):
+            raise ShowSoldOut(f"Show {show_id} is full.")
+
+        try:
+            seats = self._admit(customer_id, show_id)
+        except ShowSoldOut:
+            seat_gate.sync(show_id, 0)
+            raise
+
+        seat_gate.sync(show_id, seats.head_count)
+        seat_hub.publish(show_id, seats.head_count, seats.version)
+
+        return {"message": f"Customer {customer_id} admitted to show {show_id}"}
+
+    # returns the (head_count, version) of the show after the seat was taken
+    def _admit(self, customer_id: int, show_id: int):
         customer = self.repo_customer.get(customer_id)
         show = self.repo_show.get(show_id)
 
@@ -178,75 +283,158 @@ class GeneralServices:
         
         if customer.age < show.age_limit:
             raise ValueError(f"The customer with id {customer.id} is not old enough to attend to show with id {show.id}.")
-        
-        if customer in show.customer_list:
-            raise ValueError(f"Customer {customer.id} is already admitted to the show {show.id}")
-        
-        if show.head_count <= 0:
-            raise ValueError(f"Show {show.id} is full.")
-
-        show.customer_list.append(customer)
-        show.head_count -= 1
 
+        # the composite primary key of customer_show rejects duplicates, the conditional
+        # decrement only succeeds while seats are left; both happen in one transaction
+        try:
+            self.repo_show.add_attendee(customer_id, show_id)
+        except IntegrityError:
+            self.db.rollback()
+            # the customer was deleted while the enrollment waited on its row
+            if customer_id not in self.repo_customer.get_ages([customer_id]):
+                raise ValueError("Customer or show not found in repositories. Check your ids.")
+            raise ValueError(f"Customer {customer_id} is already admitted to the show {show_id}")
+
+        seats = self.repo_show.reserve_seats(show_id)
+        if seats is None:
+            self.db.rollback()
+            raise ShowSoldOut(f"Show {show_id} is full.")
+
+        self.stats.count_attendees(show_id, 1, -1)
+        self.repo_customer.bump_versions(CustomerORM.id == customer_id)
+        # a projection that embeds attendance also reads shows, whose head_count changed, so the
+        # customers list version stays as it is
+        self.versions.bump("shows")
         self.db.commit()
-        self.db.refresh(show)
+        entity_cache.invalidate(("customer", customer_id), ("show", show_id))
+
+        return seats
+
+    def enroll_customers_to_show(self, show_id: int, customer_ids: list[int]):
+        show = self.repo_show.get(show_id)
+        if not show:
+            raise ValueError(f"Show {show_id} not found in the repository.")
+
+        requested = list(dict.fromkeys(customer_ids))
+        ages = self.repo_customer.get_ages(requested)
+        attending = self.repo_show.get_attendee_ids(show_id, requested)
+
+        results = {}
+        eligible = []
+        for customer_id in requested:
+            if customer_id not in ages:
+                results[customer_id] = "Customer not found in the repository."
+            elif ages[customer_id] < show.age_limit:
+                results[customer_id] = f"The customer with id {customer_id} is not old enough to attend to show with id {show_id}."
+            elif customer_id in attending:
+                results[customer_id] = f"Customer {customer_id} is already admitted to the show {show_id}"
+            else:
+                eligible.append(customer_id)
+
+        # reserve as many seats as are left in one decrement, retrying if another
+        # enrollment changed head_count between the read and the update
+        admitted = []
+        reserved = None
+        seats_left = show.head_count
+        while eligible:
+            seats = min(len(eligible), max(seats_left, 0))
+            if seats == 0:
+                seat_gate.sync(show_id, 0)
+                break
+            reserved = self.repo_show.reserve_seats(show_id, seats)
+            if reserved is not None:
+                admitted = eligible[:seats]
+                break
+            self.db.refresh(show, ["head_count"])
+            seats_left = show.head_count
+
+        for customer_id in eligible[len(admitted):]:
+            results[customer_id] = f"Show {show_id} is full."
+
+        if admitted:
+            try:
+                self.repo_show.add_attendees(show_id, admitted)
+            except IntegrityError:
+                self.db.rollback()
+                raise ValueError(f"Some customers were admitted to the show {show_id} concurrently, please retry.")
+            self.stats.count_attendees(show_id, len(admitted), -len(admitted))
+            self.repo_customer.bump_versions(CustomerORM.id.in_(admitted))
+            self.versions.bump("shows")
 
-        return {"message": f"Customer {customer.id} admitted to show {show.id}"}
+        self.db.commit()
+        entity_cache.invalidate(("show", show_id), *[("customer", customer_id) for customer_id in admitted])
+        if reserved is not None:
+            seat_gate.sync(show_id, reserved.head_count)
+            seat_hub.publish(show_id, reserved.head_count, reserved.version)
+
+        for customer_id in admitted:
+            results[customer_id] = f"Customer {customer_id} admitted to show {show_id}"
+        admitted_ids = set(admitted)
+
+        return {
+            "show_id": show_id,
+            "admitted": len(admitted),
+            "results": [
+                {"customer_id": customer_id, "admitted": customer_id in admitted_ids, "message": results[customer_id]}
+                for customer_id in requested
+            ],
+        }
     
+    # each mutation is one conditional statement; the rows are only read to explain a miss
     def remove_customer_from_show(self, customer_id: int, show_id: int):
-        customer = self.repo_customer.get(customer_id)
-        show = self.repo_show.get(show_id)
+        if not self.repo_show.remove_attendee(customer_id, show_id):
+            if not self.repo_customer.get(customer_id) or not self.repo_show.get(show_id):
+                raise ValueError("Customer or show not found in repositories. Check your ids.")
+            raise ValueError(f"Customer {customer_id} not admitted to the show {show_id}")
+
+        seats = self.repo_show.release_seats(show_id)
+        self.stats.count_attendees(show_id, -1, 1)
+        self.repo_customer.bump_versions(CustomerORM.id == customer_id)
+        self.versions.bump("shows")
 
-        if not customer or not show:
-            raise ValueError("Customer or show not found in repositories. Check your ids.")
-        
-        if customer not in show.customer_list:
-            raise ValueError(f"Customer {customer.id} not admitted to the show {show.id}")
-        
-        show.customer_list.remove(customer)
-        show.head_count += 1
-        
         self.db.commit()
-        self.db.refresh(show)
+        entity_cache.invalidate(("customer", customer_id), ("show", show_id))
+        seat_gate.sync(show_id, seats.head_count)
+        seat_hub.publish(show_id, seats.head_count, seats.version)
 
-        return {"message": f"Customer {customer.id} removed from the show {show.id}"}
+        return {"message": f"Customer {customer_id} removed from the show {show_id}"}
     
     def enroll_show_to_avanue(self, show_id: int, avanue_id: int):
-        show = self.repo_show.get(show_id)
-        avanue = self.repo_avanue.get(avanue_id)
+        if not self.repo_show.assign_avanue(show_id, avanue_id):
+            show = self.repo_show.get(show_id)
+            avanue = self.repo_avanue.get(avanue_id)
 
-        if show in avanue.show_list:
-            raise ValueError(f"The show {show.id} is already admitted to the avanue {avanue.id}")
+            if not show or not avanue:
+                raise ValueError("Show or avanue not found in repositories. Check your ids.")
+
+            if show.avanue_id == avanue.id:
+                raise ValueError(f"The show {show.id} is already admitted to the avanue {avanue.id}")
+
+            if avanue.availability is False:
+                raise ValueError(f"The avanue {avanue.id} is not availabile!")
 
-        if avanue.availability is False:
-            raise ValueError(f"The avanue {avanue.id} is not availabile!")
-        
-        if show.avanue_id == avanue.id:
-            raise ValueError(f"Show {show.id} alread in avanue {avanue.id}")
-        
-        if show.avanue_id is not None:
             raise ValueError(f"Show {show.id} is already assigned to avanue {show.avanue_id}")
 
-        avanue.show_list.append(show)
+        self.stats.move_show(show_id, avanue_id, 1)
+        self.repo_avanue.bump_versions(AvanueORM.id == avanue_id)
+        self.versions.bump("shows", "avanues")
 
         self.db.commit()
-        self.db.refresh(avanue)
+        entity_cache.invalidate(("show", show_id), ("avanue", avanue_id))
 
-        return {"message": f"Show {show.id} is admitted to avanue {avanue.id}"}
+        return {"message": f"Show {show_id} is admitted to avanue {avanue_id}"}
 
     def delete_show_from_avanue(self, show_id: int, avanue_id: int):
-        show = self.repo_show.get(show_id)
-        avanue = self.repo_avanue.get(avanue_id) 
+        if not self.repo_show.unassign_avanue(show_id, avanue_id):
+            if not self.repo_avanue.get(avanue_id) or not self.repo_show.get(show_id):
+                raise ValueError("Customer or show not found in repositories. Check your ids.")
+            raise ValueError(f"Show {show_id} not found in the avanue {avanue_id}")
 
-        if not avanue or not show:
-            raise ValueError("Customer or show not found in repositories. Check your ids.")
-        
-        if show not in avanue.show_list:
-            raise ValueError(f"Show {show.id} not found in the avanue {avanue.id}")
-        
-        show.avanue = None
+        self.stats.move_show(show_id, avanue_id, -1)
+        self.repo_avanue.bump_versions(AvanueORM.id == avanue_id)
+        self.versions.bump("shows", "avanues")
 
         self.db.commit()
-        self.db.refresh(show)
+        entity_cache.invalidate(("show", show_id), ("avanue", avanue_id))
 
-        return {"message": f"Show {show.id} is deleted from avanue {avanue.id}"}
+        return {"message": f"Show {show_id} is deleted from avanue {avanue_id}"}
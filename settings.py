@@ -0,0 +1,52 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+DATABASE_ECHO = os.getenv("DATABASE_ECHO", "false").lower() == "true"
+
+# a request running one statement shape more often than this is reported as a likely N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "10"))
+
+# read-through cache for the entity detail endpoints
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "60"))
+
+# how long the in-process seat count of a show is trusted before it is read from the database again
+SEAT_GATE_RESYNC_SECONDS = float(os.getenv("SEAT_GATE_RESYNC_SECONDS", "1"))
+
+# list endpoints select only the listed columns and encode them with orjson, skipping ORM
+# hydration and pydantic validation; false keeps the ORM + response_model path
+LIST_FAST_PATH = os.getenv("LIST_FAST_PATH", "true").lower() == "true"
+
+# comma separated read-only replicas for the GET endpoints; empty sends every read to DATABASE_URL
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+# a replica that errors is skipped for this long
+REPLICA_EJECT_SECONDS = float(os.getenv("REPLICA_EJECT_SECONDS", "30"))
+# a client that wrote reads from the primary for this long, so it sees its own writes despite replica lag
+READ_YOUR_WRITES_SECONDS = int(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
+# seat availability events are coalesced to at most one per show per interval
+SEAT_EVENTS_INTERVAL_SECONDS = float(os.getenv("SEAT_EVENTS_INTERVAL_SECONDS", "0.5"))
+
+# write requests carrying an Idempotency-Key have their response stored and replayed on retries;
+# "memory" keeps them per process, "database" shares them through the idempotency_keys table
+IDEMPOTENCY_BACKEND = os.getenv("IDEMPOTENCY_BACKEND", "memory")
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "100000"))
+# how long a retry waits for the first request with its key to finish
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+
+# admission control: concurrent requests per class ("read" for GET/HEAD, "write" for the rest);
+# 0 sizes the limits from the connection pools
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "true").lower() == "true"
+ADMISSION_READ_LIMIT = int(os.getenv("ADMISSION_READ_LIMIT", "0"))
+ADMISSION_WRITE_LIMIT = int(os.getenv("ADMISSION_WRITE_LIMIT", "0"))
+# requests beyond the limit wait in a queue of this size per class for at most the timeout, then get a 503
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "100"))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "2"))
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "1"))
+
+# customer and avanue deletes run as background jobs that clear at most this many related rows per transaction
+DELETE_CHUNK_SIZE = int(os.getenv("DELETE_CHUNK_SIZE", "500"))
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# the app reads its settings on import, so the database has to be chosen before any test imports it
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}"
@@ -0,0 +1,28 @@
+from sqlalchemy import select
+from database import SessionLocal
+from models import CustomerORM, ShowORM
+from services import CRUDServices, GeneralServices
+import schemas
+
+
+def test_chunked_customer_delete_gives_every_seat_back():
+    with SessionLocal() as db:
+        shows = [CRUDServices.ShowService(db).enroll_show(schemas.ShowAdd(title=f"Deleted {i}", age_limit=18, head_count=3)).id for i in range(3)]
+        customer = CRUDServices.CustomerService(db).enroll_customer(schemas.CustomerAdd(name="Deleted", age=30)).id
+    for show in shows:
+        with SessionLocal() as db:
+            GeneralServices(db).enroll_customer_to_show(customer, show)
+
+    chunks = []
+    finished = False
+    while not finished:
+        with SessionLocal() as db:
+            processed, finished = CRUDServices.CustomerService(db).delete_customer_chunk(customer, 2)
+        chunks.append(processed)
+
+    with SessionLocal() as db:
+        assert db.get(CustomerORM, customer) is None
+        assert set(db.scalars(select(ShowORM.head_count).where(ShowORM.id.in_(shows)))) == {3}
+        # a chunk for a customer that is already gone finishes straight away
+        assert CRUDServices.CustomerService(db).delete_customer_chunk(customer, 2) == (0, True)
+    assert chunks == [2, 1]
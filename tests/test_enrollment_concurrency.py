@@ -0,0 +1,42 @@
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import func, select
+from database import SessionLocal
+from models import ShowORM, customer_show
+from seatgate import ShowSoldOut
+from services import CRUDServices, GeneralServices
+import schemas
+
+SEATS = 10
+CUSTOMERS = 60
+THREADS = 16
+
+
+def _enroll(customer_id: int, show_id: int) -> bool:
+    db = SessionLocal()
+    try:
+        GeneralServices(db).enroll_customer_to_show(customer_id, show_id)
+        return True
+    except ShowSoldOut:
+        return False
+    finally:
+        db.close()
+
+
+def test_concurrent_enrollments_never_oversell():
+    with SessionLocal() as db:
+        show = CRUDServices.ShowService(db).enroll_show(schemas.ShowAdd(title="On sale", age_limit=18, head_count=SEATS))
+        customers = [
+            CRUDServices.CustomerService(db).enroll_customer(schemas.CustomerAdd(name=f"Customer {i}", age=30))
+            for i in range(CUSTOMERS)
+        ]
+
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        admitted = list(pool.map(lambda customer: _enroll(customer.id, show.id), customers))
+
+    with SessionLocal() as db:
+        head_count = db.scalar(select(ShowORM.head_count).where(ShowORM.id == show.id))
+        attendees = db.scalar(select(func.count()).select_from(customer_show).where(customer_show.c.show_id == show.id))
+
+    assert admitted.count(True) == SEATS
+    assert head_count == 0
+    assert attendees == SEATS
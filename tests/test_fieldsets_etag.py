@@ -0,0 +1,42 @@
+from fastapi.testclient import TestClient
+import main
+
+ENROLL = "/general_services/enroll_customer_to_show/"
+
+
+def _conditional_status(client: TestClient, url: str, etag: str) -> int:
+    return client.get(url, headers={"If-None-Match": etag}).status_code
+
+
+def test_nested_expansion_etag_changes_with_the_second_level():
+    with TestClient(main.app) as client:
+        shows = [client.post("/add/show/", json={"title": f"Nested {i}", "age_limit": 18, "head_count": 10}).json()["id"] for i in range(2)]
+        customers = [client.post("/add/customer/", json={"name": f"Nested {i}", "age": 30}).json()["id"] for i in range(2)]
+        client.post(ENROLL, params={"customer_id": customers[0], "show_id": shows[0]})
+        client.post(ENROLL, params={"customer_id": customers[0], "show_id": shows[1]})
+
+        url = f"/show/{shows[0]}?expand=customer_list.show_list"
+        etag = client.get(url).headers["ETag"]
+        assert _conditional_status(client, url, etag) == 304
+
+        # only show 2 changes, it is two levels below show 1
+        client.post(ENROLL, params={"customer_id": customers[1], "show_id": shows[1]})
+        assert _conditional_status(client, url, etag) == 200
+
+
+def test_nested_expansion_etag_changes_with_a_customer_of_an_avanue():
+    with TestClient(main.app) as client:
+        avanue = client.post("/add/avanue/", json={"name": "Nested", "availability": True}).json()["id"]
+        show = client.post("/add/show/", json={"title": "Nested", "age_limit": 18, "head_count": 10}).json()["id"]
+        customer = client.post("/add/customer/", json={"name": "Nested", "age": 30}).json()["id"]
+        client.post("/general_services/show_to_avanue/", params={"show_id": show, "avanue_id": avanue})
+        client.post(ENROLL, params={"customer_id": customer, "show_id": show})
+
+        url = f"/avanue/{avanue}?expand=show_list.customer_list"
+        etag = client.get(url).headers["ETag"]
+        assert _conditional_status(client, url, etag) == 304
+
+        client.patch(f"/update/customer/{customer}", params={"id": customer}, json={"name": "Renamed"})
+        response = client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.json()["show_list"][0]["customer_list"][0]["name"] == "Renamed"
@@ -0,0 +1,34 @@
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
+from database import SessionLocal
+from models import customer_show
+from services import CRUDServices, GeneralServices
+import schemas
+import transfer
+
+
+def test_a_failing_show_only_fails_its_own_enrollment_rows(monkeypatch):
+    with SessionLocal() as db:
+        shows = [CRUDServices.ShowService(db).enroll_show(schemas.ShowAdd(title=f"Import {i}", age_limit=18, head_count=5)).id for i in range(2)]
+        customers = [CRUDServices.CustomerService(db).enroll_customer(schemas.CustomerAdd(name=f"Import {i}", age=30)).id for i in range(2)]
+
+    enroll = GeneralServices.enroll_customers_to_show
+
+    def locked_second_show(self, show_id, customer_ids):
+        if show_id == shows[1]:
+            raise OperationalError("INSERT", {}, Exception("database is locked"))
+        return enroll(self, show_id, customer_ids)
+
+    monkeypatch.setattr(GeneralServices, "enroll_customers_to_show", locked_second_show)
+    chunk = [
+        (1, {"customer_id": customers[0], "show_id": shows[0]}),
+        (2, {"customer_id": customers[1], "show_id": shows[0]}),
+        (3, {"customer_id": customers[0], "show_id": shows[1]}),
+    ]
+    with SessionLocal() as db:
+        inserted, errors = transfer.import_chunk(db, "enrollments", chunk)
+        stored = db.scalar(select(func.count()).select_from(customer_show).where(customer_show.c.show_id == shows[0]))
+
+    assert inserted == 2
+    assert [row for row, _ in errors] == [3]
+    assert stored == 2
@@ -0,0 +1,14 @@
+from fastapi.testclient import TestClient
+import main
+
+
+def test_query_count_headers_only_on_complete_responses():
+    with TestClient(main.app) as client:
+        client.post("/add/customer/", json={"name": "Counted", "age": 30})
+
+        assert int(client.get("/?limit=5").headers["X-Query-Count"]) > 0
+        for url in ("/?stream=true", "/export/customers/"):
+            response = client.get(url)
+            assert response.status_code == 200
+            assert "X-Query-Count" not in response.headers
+            assert "X-DB-Time-Ms" not in response.headers
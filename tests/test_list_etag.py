@@ -0,0 +1,22 @@
+from fastapi.testclient import TestClient
+import main
+
+
+def _conditional_status(client: TestClient, url: str, etag: str) -> int:
+    return client.get(url, headers={"If-None-Match": etag}).status_code
+
+
+def test_list_versions_follow_committed_writes():
+    with TestClient(main.app) as client:
+        show = client.post("/add/show/", json={"title": "Listed", "age_limit": 18, "head_count": 5}).json()["id"]
+        customer = client.post("/add/customer/", json={"name": "Listed", "age": 30}).json()["id"]
+        customers = client.get("/?limit=10").headers["ETag"]
+        shows = client.get("/shows/?limit=10").headers["ETag"]
+
+        # enrolling changes head_count, the customers list holds nothing an enrollment changes
+        client.post("/general_services/enroll_customer_to_show/", params={"customer_id": customer, "show_id": show})
+        assert _conditional_status(client, "/shows/?limit=10", shows) == 200
+        assert _conditional_status(client, "/?limit=10", customers) == 304
+
+        client.patch(f"/update/customer/{customer}", params={"id": customer}, json={"name": "Renamed"})
+        assert _conditional_status(client, "/?limit=10", customers) == 200
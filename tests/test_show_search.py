@@ -0,0 +1,13 @@
+from fastapi.testclient import TestClient
+import main
+
+
+def test_title_filter_is_a_case_sensitive_literal_prefix():
+    with TestClient(main.app) as client:
+        for title in ("Prefix one", "PREFIX two", "Pre%fix", "Prey"):
+            client.post("/add/show/", json={"title": title, "age_limit": 1, "head_count": 2})
+
+        titles = lambda prefix: [show["title"] for show in client.get("/shows/search/", params={"title": prefix}).json()]
+        assert titles("Prefix") == ["Prefix one"]
+        assert titles("PREFIX") == ["PREFIX two"]
+        assert titles("Pre%") == ["Pre%fix"]
@@ -0,0 +1,177 @@
+import csv
+import io
+import json
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+from repositories import CustomerRepository, ShowRepository, AvanueRepository
+from services import CRUDServices, GeneralServices
+import schemas
+
+MAX_REPORTED_ERRORS = 1000
+
+IMPORT_SCHEMAS = {
+    "customers": schemas.CustomerAdd,
+    "shows": schemas.ShowAdd,
+    "avanues": schemas.AvanueAdd,
+    "enrollments": schemas.EnrollmentAdd,
+}
+
+# repository and stream method per exported entity, with the columns written for each row
+EXPORTS = {
+    "customers": (CustomerRepository, "stream_all", ("id", "name", "age")),
+    "shows": (ShowRepository, "stream_all", ("id", "title", "age_limit", "head_count", "avanue_id")),
+    "avanues": (AvanueRepository, "stream_all", ("id", "name", "availability")),
+    "enrollments": (ShowRepository, "stream_attendance", ("customer_id", "show_id")),
+}
+
+
+async def _lines(stream):
+    buffer = b""
+    async for data in stream:
+        buffer += data
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8-sig").rstrip("\r")
+    if buffer:
+        yield buffer.decode("utf-8-sig").rstrip("\r")
+
+
+async def _csv_lines(stream):
+    # a quoted field may span lines, keep reading until the quotes are balanced
+    pending = None
+    async for line in _lines(stream):
+        pending = line if pending is None else pending + "\n" + line
+        if pending.count('"') % 2 == 0:
+            yield pending
+            pending = None
+    if pending is not None:
+        yield pending
+
+
+# yields (row number, record) where a record that could not be parsed is its error message
+async def read_records(stream, format: str):
+    row = 0
+    if format == "ndjson":
+        async for line in _lines(stream):
+            if not line.strip():
+                continue
+            row += 1
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield row, f"Invalid JSON: {e}"
+                continue
+            yield row, record if isinstance(record, dict) else "Every line must be a JSON object."
+        return
+
+    header = None
+    async for line in _csv_lines(stream):
+        if not line.strip():
+            continue
+        values = next(csv.reader([line]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        row += 1
+        if len(values) != len(header):
+            yield row, f"Expected {len(header)} columns, got {len(values)}."
+            continue
+        # an empty cell means the column was left out, so schema defaults apply
+        yield row, {name: value for name, value in zip(header, values) if value != ""}
+
+
+async def read_chunks(stream, format: str, size: int):
+    chunk = []
+    async for record in read_records(stream, format):
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in e['loc']) or 'row'}: {e['msg']}" for e in error.errors())
+
+
+def _enroll(db: Session, payloads: list[schemas.EnrollmentAdd]):
+    positions_by_show: dict[int, dict[int, int]] = {}
+    errors = []
+    for position, payload in enumerate(payloads):
+        positions = positions_by_show.setdefault(payload.show_id, {})
+        if payload.customer_id in positions:
+            errors.append((position, f"Customer {payload.customer_id} appears twice for show {payload.show_id}."))
+            continue
+        positions[payload.customer_id] = position
+
+    # every show commits on its own, so a failing show only fails its own rows
+    inserted = 0
+    services = GeneralServices(db)
+    for show_id, positions in positions_by_show.items():
+        try:
+            result = services.enroll_customers_to_show(show_id, list(positions))
+        except Exception as e:
+            db.rollback()
+            errors += [(position, f"{e}") for position in positions.values()]
+            continue
+        inserted += result["admitted"]
+        errors += [(positions[r["customer_id"]], r["message"]) for r in result["results"] if not r["admitted"]]
+
+    return inserted, errors
+
+
+IMPORTERS = {
+    "customers": lambda db, payloads: CRUDServices.CustomerService(db).enroll_customers(payloads),
+    "shows": lambda db, payloads: CRUDServices.ShowService(db).enroll_shows(payloads),
+    "avanues": lambda db, payloads: CRUDServices.AvanueService(db).enroll_avanues(payloads),
+    "enrollments": _enroll,
+}
+
+
+# validates and stores one chunk; returns the number of rows stored and the (row, message) of every rejected row
+def import_chunk(db: Session, entity: str, chunk: list[tuple[int, dict | str]]):
+    schema = IMPORT_SCHEMAS[entity]
+    errors = []
+    payloads = []
+    rows = []
+    for row, record in chunk:
+        if isinstance(record, str):
+            errors.append((row, record))
+            continue
+        try:
+            payloads.append(schema.model_validate(record))
+        except ValidationError as e:
+            errors.append((row, _validation_message(e)))
+            continue
+        rows.append(row)
+
+    if not payloads:
+        return 0, errors
+
+    try:
+        inserted, failed = IMPORTERS[entity](db, payloads)
+    except Exception as e:
+        db.rollback()
+        return 0, sorted(errors + [(row, f"{e}") for row in rows])
+
+    return inserted, sorted(errors + [(rows[position], message) for position, message in failed])
+
+
+def csv_header(entity: str) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(EXPORTS[entity][2])
+    return buffer.getvalue()
+
+
+def encoder(entity: str, format: str):
+    columns = EXPORTS[entity][2]
+    if format == "ndjson":
+        return lambda batch: "".join(json.dumps({column: getattr(row, column) for column in columns}) + "\n" for row in batch)
+
+    def encode_csv(batch):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows([getattr(row, column) for column in columns] for row in batch)
+        return buffer.getvalue()
+
+    return encode_csv